@@ -1,7 +1,6 @@
 import gamelib
 import random
 from sys import maxsize
-import json
 
 
 """
@@ -14,7 +13,8 @@ Advanced strategy tips:
 
   - The GameState.map object can be manually manipulated to create hypothetical 
   board states. Though, we recommended making a copy of the map to preserve 
-  the actual current map state.
+  the actual current map state. game_state.clone() and game_map.fork() make
+  cheap copies, game_state.checkpoint() and rollback() undo trial edits.
 """
 
 class AlgoStrategy(gamelib.AlgoCore):
@@ -47,6 +47,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.attack_direction = 0
         self.last_attacked = 0
         self.main_attack_locations = [[24, 10], [3, 10]]
+        # on_action_frame only looks at breaches, so skip every other frame
+        self.subscribe_action_frames(["breach"])
 
     def on_turn(self, turn_state):
         """
@@ -489,13 +491,12 @@ class AlgoStrategy(gamelib.AlgoCore):
         """
         damages = []
         paths = []
+        threat_map = game_state.get_threat_map()
+        turret_damage = gamelib.GameUnit(TURRET, game_state.config).damage_i
         # Get the damage estimate each path will take
-        for location in location_options:
-            path = game_state.find_path_to_edge(location)
-            damage = 0
-            for path_location in path:
-                # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
+        for location, path in zip(location_options, game_state.find_paths_to_edge_batch(location_options)):
+            # Get number of enemy turrets that can attack each location and multiply by turret damage
+            damage = threat_map.path_attacker_count(path, 0) * turret_damage
 
             if path[-1] not in self.top_left + self.top_right:
                 damage *= 2
@@ -522,7 +523,7 @@ class AlgoStrategy(gamelib.AlgoCore):
                 filtered.append(location)
         return filtered
 
-    def on_action_frame(self, turn_string):
+    def on_action_frame(self, frame_state):
         """
         This is the action frame of the game. This function could be called 
         hundreds of times per turn and could slow the algo down so avoid putting slow code here.
@@ -530,8 +531,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         Full doc on format of a game frame at in json-docs.html in the root of the Starterkit.
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
+        events = frame_state["events"]
         breaches = events["breach"]
         for breach in breaches:
             location = breach[0]
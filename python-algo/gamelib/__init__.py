@@ -8,7 +8,8 @@ The GameMap class in game_map.py represents the current game map. It can be used
 Investigating it is useful for any player that wants to access more information about the current state of the game. \n
 
 The GameUnit class in unit.py represetns a single unit. 
-Investigating it is useful for any player that wants to access information about units. \n
+Investigating it is useful for any player that wants to access information about units. 
+The UnitStore class in unit_store.py holds units as columns, see the lazy_units option of GameState. \n
 
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
 Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
@@ -16,14 +17,35 @@ Investigating it is useful for advanced players interested in getting data from
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
+The ThreatMap class in threat_map.py holds the damage enemy structures can deal at every location. 
+GameState.get_threat_map() builds one and keeps it up to date as you spawn and upgrade units. \n
+
+The Simulator class in simulator.py plays out an action phase frame by frame on a copy of the board. 
+It is useful to compare candidate attacks before deploying them. \n
+
+The WorkerPool class in worker_pool.py runs candidate evaluations, such as simulations, on several cores. \n
+
+The TurnClock class in turn_clock.py tracks the time left in a turn and runs anytime searches until it runs out, see AlgoCore.add_search. \n
+
+The Profiler class in profiler.py counts and times calls to the hot functions of gamelib, see AlgoCore.enable_profiling. \n
+
+The ResourceForecast class in resource_forecast.py projects the SP and MP of both players over the next turns for a plan of spending. \n
+
 util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
 """
 
 from .algocore import AlgoCore
 from .util import debug_write
-from .game_state import GameState
+from .game_state import GameState, LazyGameState
 from .unit import GameUnit
+from .unit_store import UnitStore
 from .game_map import GameMap
-
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+from .threat_map import ThreatMap
+from .simulator import Simulator
+from .worker_pool import WorkerPool
+from .turn_clock import TurnClock
+from .profiler import Profiler
+from .resource_forecast import ResourceForecast
+
+__all__ = ["algocore", "benchmark", "game_state", "game_map", "navigation", "profiler", "resource_forecast", "simulator", "threat_map", "turn_clock", "unit", "unit_store", "util", "worker_pool"]
  
\ No newline at end of file
@@ -1,7 +1,17 @@
-import json
+import queue
+import sys
+import threading
+import time
 
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .profiler import Profiler
+from .turn_clock import TurnClock
+from .util import get_command, debug_write, decode, BANNER_TEXT, send_command
+
+"""
+Event types an action frame can hold, see subscribe_action_frames
+"""
+ACTION_FRAME_EVENTS = ("selfDestruct", "breach", "damage", "shield", "move", "spawn", "death", "attack", "melee")
 
 class AlgoCore(object):
     """
@@ -10,10 +20,140 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * worker_pool (:obj: WorkerPool): Set it in on_game_start to evaluate moves on several cores, it is closed when the game ends
+        * skipped_action_frames (int): The number of action frames skipped because of subscribe_action_frames
+        * coalesced_action_frames (int): The number of action frames merged into a later one, see start
+        * turn_clock (:obj: TurnClock): Started when a turn message arrives, tells on_turn how much time it has left
+        * profiler (:obj: Profiler): Times the hot functions of gamelib once enable_profiling is called, None otherwise
 
     """
     def __init__(self):
         self.config = None
+        self.worker_pool = None
+        self.skipped_action_frames = 0
+        self.coalesced_action_frames = 0
+        self._frame_events = None
+        self.turn_clock = TurnClock()
+        self._time_limit = None
+        self._turn_received = None
+        self._searches = []
+        self._search_state = None
+        self.profiler = None
+
+    def enable_profiling(self, output=None, targets=None):
+        """Times the hot functions of gamelib and reports them after every turn.
+        The report of a turn covers the calls made since the previous report, so it includes
+        the action phase frames handled before the turn.
+
+        Args:
+            output: The path of a file to add the reports to, None to write them to stderr
+            targets: The functions to time, see Profiler.enable
+
+        """
+        if self.profiler is None:
+            self.profiler = Profiler(output)
+        self.profiler.output = output
+        self.profiler.enable(targets)
+
+    def set_turn_budget(self, time_limit=None, safety_margin=None):
+        """Sets the time turn_clock allows per turn
+
+        Args:
+            time_limit: The number of seconds per turn, None to use the soft time limit of the game config
+            safety_margin: The number of seconds kept free to deploy and submit, unchanged if None
+
+        """
+        self._time_limit = time_limit
+        if time_limit is not None:
+            self.turn_clock.time_limit = time_limit
+        elif self.config is not None:
+            self.turn_clock.time_limit = TurnClock.time_limit_from_config(self.config)
+        if safety_margin is not None:
+            self.turn_clock.safety_margin = safety_margin
+
+    def add_search(self, game_state, search, on_result=None):
+        """Registers an anytime search to run once on_turn returns.
+        Searches registered during a turn are stepped in turn until they all finish or turn_clock runs out.
+        on_result is then called with the last result of each search, and game_state.submit_turn() is called
+        once for the turn, so on_turn must not submit the turn itself when it registers a search.
+
+        Args:
+            game_state: The GameState of the turn, submitted once every search is done
+            search: An iterator, usually a generator, yielding a better result at each step, see TurnClock.run_all
+            on_result: A function called with the game state and the last result of the search, None if the search
+                yielded nothing in time. It typically deploys the result with attempt_spawn.
+
+        """
+        if self._search_state is not None and self._search_state is not game_state:
+            debug_write("add_search was called with two game states in the same turn, only the first one will be submitted")
+        else:
+            self._search_state = game_state
+        self._searches.append((search, on_result))
+
+    def _run_searches(self):
+        """Runs the searches registered with add_search, then submits the turn
+        """
+        searches, game_state = self._searches, self._search_state
+        self._searches, self._search_state = [], None
+        if game_state is None:
+            return
+        try:
+            results = self.turn_clock.run_all([search for search, _ in searches])
+            for (_, on_result), result in zip(searches, results):
+                if on_result is not None:
+                    on_result(game_state, result)
+        finally:
+            game_state.submit_turn()
+
+    def subscribe_action_frames(self, event_types=None):
+        """Chooses which action frames are passed to on_action_frame.
+        Frames in the engine's usual layout are checked on the raw message before decoding, so skipped
+        frames cost almost nothing. Other frames are checked once decoded.
+
+        Args:
+            event_types: A list of event types from ACTION_FRAME_EVENTS, such as ["breach", "death"].
+                Only frames with at least one event of these types are passed on. An empty list skips
+                every action frame, None passes every action frame (the default).
+
+        """
+        if event_types is None:
+            self._frame_events = None
+            return
+        for event_type in event_types:
+            if event_type not in ACTION_FRAME_EVENTS:
+                debug_write("Unknown action frame event type {}, expected one of {}".format(event_type, ACTION_FRAME_EVENTS))
+        self._frame_events = tuple(event_types)
+
+    def _raw_frame_check(self, message):
+        """Checks the raw message of an action frame against the subscribed event types, without decoding it.
+        The engine writes empty event lists as "type":[] and non empty ones as "type":[[...
+
+        Returns:
+            True if the frame is wanted, False if it can be skipped, None if the message is written
+            differently and has to be decoded to tell, see _wants_action_frame
+
+        """
+        event_types = self._frame_events
+        if event_types is None:
+            return True
+        if not event_types:
+            return False
+        for event_type in event_types:
+            if '"{}":[['.format(event_type) in message:
+                return True
+        for event_type in event_types:
+            if '"{}":[]'.format(event_type) not in message:
+                return None
+        return False
+
+    def _wants_action_frame(self, state):
+        """Checks the events of a decoded action frame against the subscribed event types
+        """
+        event_types = self._frame_events
+        if event_types is None:
+            return True
+        events = state.get("events", {})
+        return any(events.get(event_type) for event_type in event_types)
 
     def on_game_start(self, config):
         """
@@ -26,7 +166,7 @@ class AlgoCore(object):
     def on_turn(self, game_state):
         """
         This step function is called at the start of each turn.
-        It is passed the current game state, which can be used to initiate a new GameState object. 
+        It is passed the current game state, already decoded to a dict, which can be used to initiate a new GameState object. 
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
@@ -40,56 +180,182 @@ class AlgoCore(object):
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
         They can be handled in this function. 
+        The frame is passed already decoded to a dict. Wrap it in a LazyGameState to only
+        build the board when you need more than its events.
         """
         pass
 
 
-    def start(self):
+    def start(self, threaded_input=False, queue_size=256, coalesce_action_frames=False):
         """ 
         Start the parsing loop.
         After starting the algo, it will wait until it recieves information from the game 
         engine, proccess this information, and respond if needed to take it's turn. 
         The algo continues this loop until it recieves the "End" turn message from the game.
+
+        Args:
+            threaded_input: If True, a reader thread drains stdin and decodes the messages while
+                the strategy runs, so messages that arrive during a long computation are ready when it ends
+            queue_size: The number of decoded messages the reader thread can hold before it waits
+            coalesce_action_frames: With threaded_input, when several action frames are waiting only the
+                latest one is passed to on_action_frame, with the events of the skipped frames added to its own
         """
         debug_write(BANNER_TEXT)
 
+        if threaded_input:
+            messages = queue.Queue(queue_size)
+            reader = threading.Thread(target=self._read_input, args=(messages,), daemon=True)
+            reader.start()
+            incoming = self._queued_messages(messages, coalesce_action_frames)
+        else:
+            incoming = self._stdin_messages()
+        for game_state_string, state in incoming:
+            if not self._handle_message(game_state_string, state):
+                break
+
+    def _stdin_messages(self):
+        """Yields (message, None) pairs, reading stdin in the calling thread
+        """
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
-            game_state_string = get_command()
-            if "replaySave" in game_state_string:
+            yield get_command(), None
+
+    def _read_input(self, messages):
+        """Reader thread of threaded_input: puts (message, decoded state) pairs in the queue,
+        skipping the action frames nobody subscribed to, then _END_OF_INPUT
+        """
+        while True:
+            try:
+                game_state_string = sys.stdin.readline()
+            except (EOFError, ValueError):
+                game_state_string = ""
+            if game_state_string == "":
+                messages.put(_END_OF_INPUT)
+                return
+            if '"turnInfo":[1,' in game_state_string and self._raw_frame_check(game_state_string) is False:
+                self.skipped_action_frames += 1
+                continue
+            received = time.perf_counter()
+            state = None
+            if "replaySave" in game_state_string or "turnInfo" in game_state_string:
+                state = decode(game_state_string)
+                if "turnInfo" in state and int(state["turnInfo"][0]) == 0:
+                    self._turn_received = received
+                if "turnInfo" in state and int(state["turnInfo"][0]) == 1 and not self._wants_action_frame(state):
+                    self.skipped_action_frames += 1
+                    continue
+            messages.put((game_state_string, state))
+            if state is not None and "turnInfo" in state and int(state["turnInfo"][0]) == 2:
+                return
+
+    def _queued_messages(self, messages, coalesce_action_frames):
+        """Yields the (message, state) pairs of the reader thread, merging waiting action frames if asked to
+        """
+        pending = None
+        while True:
+            item = pending if pending is not None else messages.get()
+            pending = None
+            if item is _END_OF_INPUT:
+                # Happens if parent game process dies, so exit for cleanup
+                debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+                exit()
+            if coalesce_action_frames and _is_action_frame(item):
+                while pending is None:
+                    try:
+                        following = messages.get_nowait()
+                    except queue.Empty:
+                        break
+                    if following is not _END_OF_INPUT and _is_action_frame(following):
+                        item = _merge_action_frames(item, following)
+                        self.coalesced_action_frames += 1
+                    else:
+                        pending = following
+            yield item
+
+    def _handle_message(self, game_state_string, state=None):
+        """Passes one message to the matching callback
+
+        Args:
+            game_state_string: The raw message
+            state: The decoded message, decoded here if None
+
+        Returns:
+            False once the game is over, True otherwise
+
+        """
+        received = time.perf_counter()
+        if "replaySave" in game_state_string:
+            """
+            This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
+            """
+            parsed_config = state if state is not None else decode(game_state_string)
+            if self._time_limit is None:
+                self.turn_clock.time_limit = TurnClock.time_limit_from_config(parsed_config)
+            self.on_game_start(parsed_config)
+        elif "turnInfo" in game_state_string:
+            if state is None:
+                if '"turnInfo":[1,' in game_state_string and self._raw_frame_check(game_state_string) is False:
+                    self.skipped_action_frames += 1
+                    return True
+                state = decode(game_state_string)
+            stateType = int(state.get("turnInfo")[0])
+            if stateType == 0:
+                """
+                This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
+                deploy phase. Printing is handled by the provided functions.
+                """
+                self.turn_clock.start(self._turn_received or received)
+                self._turn_received = None
+                self.on_turn(state)
+                self._run_searches()
+                self.turn_clock.stop()
+                if self.profiler is not None and self.profiler.enabled:
+                    self.profiler.end_turn(state["turnInfo"][1], self.turn_clock.last_turn_time)
+            elif stateType == 1:
                 """
-                This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
+                If stateType == 1, this game_state_string string represents a single frame of an action phase
                 """
-                parsed_config = json.loads(game_state_string)
-                self.on_game_start(parsed_config)
-            elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
-                if stateType == 0:
-                    """
-                    This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
-                    deploy phase. Printing is handled by the provided functions.
-                    """
-                    self.on_turn(game_state_string)
-                elif stateType == 1:
-                    """
-                    If stateType == 1, this game_state_string string represents a single frame of an action phase
-                    """
-                    self.on_action_frame(game_state_string)
-                elif stateType == 2:
-                    """
-                    This is the end game message. This means the game is over so break and finish the program.
-                    """
-                    debug_write("Got end state, game over. Stopping algo.")
-                    break
-                else:
-                    """
-                    Something is wrong? Received an incorrect or improperly formatted string.
-                    """
-                    debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+                if not self._wants_action_frame(state):
+                    self.skipped_action_frames += 1
+                    return True
+                self.on_action_frame(state)
+            elif stateType == 2:
+                """
+                This is the end game message. This means the game is over so break and finish the program.
+                """
+                debug_write("Got end state, game over. Stopping algo.")
+                if self.worker_pool is not None:
+                    self.worker_pool.close()
+                if self.profiler is not None:
+                    self.profiler.disable()
+                return False
             else:
                 """
                 Something is wrong? Received an incorrect or improperly formatted string.
                 """
-                debug_write("Got unexpected string : {}".format(game_state_string))
+                debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+        else:
+            """
+            Something is wrong? Received an incorrect or improperly formatted string.
+            """
+            debug_write("Got unexpected string : {}".format(game_state_string))
+        return True
+
+
+_END_OF_INPUT = object()
+
+
+def _is_action_frame(item):
+    state = item[1]
+    return state is not None and "turnInfo" in state and int(state["turnInfo"][0]) == 1
+
+
+def _merge_action_frames(earlier, later):
+    """Returns the later frame with the events of the earlier frame added in front of its own
+    """
+    earlier_events = earlier[1].get("events", {})
+    later_events = later[1].setdefault("events", {})
+    for event_type, events in earlier_events.items():
+        later_events[event_type] = events + later_events.get(event_type, [])
+    return later
@@ -0,0 +1,350 @@
+"""
+Benchmarks for the hot paths of gamelib.
+
+Run it from the python-algo folder, before and after changing gamelib:
+
+    python -m gamelib.benchmark --save baseline.json
+    python -m gamelib.benchmark --baseline baseline.json
+
+Each benchmark reports operations per second over a set of boards. The boards are the turn
+messages and last action frames with units found in the replay files, plus mid and late game
+boards generated from a fixed seed, since recorded replays rarely keep many turns. The config
+is read from the first replay file.
+
+With --baseline, every benchmark slower than the baseline by more than --tolerance is reported
+as a regression and the exit code is 1.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+from .game_map import GameMap
+from .game_state import GameState
+from .unit import GameUnit
+from .util import decode
+
+DEFAULT_REPLAYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "replays", "*.replay")
+
+"""
+(name, seed, turn_number, structures per player, upgraded structures per player, mobile units per player)
+"""
+GENERATED_BOARDS = (("mid_game", 1, 15, 40, 6, 12), ("late_game", 2, 40, 90, 30, 40))
+
+
+def read_replay(path):
+    """Reads the config and boards of a replay file
+
+    Args:
+        path: The path of a .replay file
+
+    Returns:
+        A (config, boards) pair, where boards is a list of (name, serialized game state) pairs holding every
+        turn message and the last action frame of every turn that have at least one unit
+
+    """
+    with open(path) as replay:
+        lines = [line.strip() for line in replay if line.strip()]
+    config = decode(lines[0])
+    boards = []
+    last_frames = {}
+    name = os.path.splitext(os.path.basename(path))[0]
+    for line in lines[1:]:
+        state = decode(line)
+        if "turnInfo" not in state or not any(state.get("p1Units", [])) and not any(state.get("p2Units", [])):
+            continue
+        state_type, turn_number = int(state["turnInfo"][0]), int(state["turnInfo"][1])
+        if state_type == 0:
+            boards.append(("{} turn {}".format(name, turn_number), line))
+        elif state_type == 1:
+            last_frames[turn_number] = line
+    for turn_number, line in sorted(last_frames.items()):
+        boards.append(("{} turn {} frame".format(name, turn_number), line))
+    return config, boards
+
+
+def generate_board(config, seed, turn_number, structures, upgrades, mobile_units):
+    """Makes a serialized game state with random structures and mobile units for both players
+
+    Each player gets a wall line with a few gaps across the middle of the board, turrets behind it
+    and random structures further back, then mobile units on random free locations of its half.
+
+    Args:
+        config: The game config
+        seed: The random seed, the same seed always gives the same board
+        turn_number: The turn number of the board
+        structures: The number of structures per player
+        upgrades: The number of upgraded structures per player
+        mobile_units: The number of mobile units per player
+
+    Returns:
+        The game state as a json string
+
+    """
+    rng = random.Random(seed)
+    game_map = GameMap(config)
+    unit_information = config["unitInformation"]
+    wall, support, turret = (unit_information[i]["shorthand"] for i in range(3))
+    mobile_types = [unit_information[i]["shorthand"] for i in range(3, 6)]
+    type_index = {unit_info.get("shorthand"): i for i, unit_info in enumerate(unit_information)}
+    unit_lists = ([[] for _ in unit_information], [[] for _ in unit_information])
+    next_id = [0]
+
+    def add(player_index, unit_type, x, y):
+        next_id[0] += 1
+        health = GameUnit(unit_type, config).max_health
+        unit_lists[player_index][type_index[unit_type]].append([x, y, health, str(next_id[0])])
+
+    for player_index in (0, 1):
+        mirror = (lambda y: y) if player_index == 0 else (lambda y: game_map.ARENA_SIZE - 1 - y)
+        half = [[x, y] for x in range(game_map.ARENA_SIZE) for y in range(game_map.HALF_ARENA)
+                if game_map.in_arena_bounds([x, y])]
+        wall_row = [x for x in range(game_map.ARENA_SIZE) if rng.random() > 0.2]
+        chosen = [(wall, x, 13) for x in wall_row[:structures // 2]]
+        chosen += [(turret, x, 12) for x in rng.sample(range(1, game_map.ARENA_SIZE - 1), min(structures // 4, 26))]
+        taken = set((x, y) for _, x, y in chosen)
+        back = [location for location in half if tuple(location) not in taken and location[1] < 12]
+        rng.shuffle(back)
+        for x, y in back[:max(0, structures - len(chosen))]:
+            chosen.append((rng.choice([wall, support, turret]), x, y))
+        structure_locations = []
+        for unit_type, x, y in chosen:
+            add(player_index, unit_type, x, mirror(y))
+            structure_locations.append([x, mirror(y)])
+        for x, y in rng.sample(structure_locations, min(upgrades, len(structure_locations))):
+            unit_lists[player_index][-1].append([x, y, 0.0, ""])
+        taken = set((x, y) for _, x, y in chosen)
+        free = [location for location in half if tuple(location) not in taken]
+        for x, y in rng.sample(free, min(mobile_units, len(free))):
+            add(player_index, rng.choice(mobile_types), x, mirror(y))
+
+    starting_health = config["resources"]["startingHP"]
+    state = {
+        "p2Units": unit_lists[1],
+        "turnInfo": [0, turn_number, -1, 0],
+        "p1Stats": [starting_health, 30.0, 12.0, 0],
+        "p1Units": unit_lists[0],
+        "p2Stats": [starting_health, 30.0, 12.0, 0],
+        "events": {},
+    }
+    return json.dumps(state)
+
+
+def load_boards(replay_paths):
+    """Gathers the config and every board to benchmark
+
+    Args:
+        replay_paths: A list of replay file paths, the config comes from the first one
+
+    Returns:
+        A (config, boards) pair, boards being a list of (name, serialized game state) pairs,
+        (None, []) if there is no replay to read the config from
+
+    """
+    config = None
+    boards = []
+    for path in replay_paths:
+        replay_config, replay_boards = read_replay(path)
+        if config is None:
+            config = replay_config
+        boards.extend(replay_boards)
+    if config is None:
+        return None, []
+    for name, seed, turn_number, structures, upgrades, mobile_units in GENERATED_BOARDS:
+        boards.append((name, generate_board(config, seed, turn_number, structures, upgrades, mobile_units)))
+    return config, boards
+
+
+def _spawn_points(game_state):
+    game_map = game_state.game_map
+    edges = game_map.get_edge_locations(game_map.BOTTOM_LEFT) + game_map.get_edge_locations(game_map.BOTTOM_RIGHT)
+    return [location for location in edges if not game_state.contains_stationary_unit(location)]
+
+
+def _attacking_units(game_state):
+    units = []
+    for x in range(game_state.ARENA_SIZE):
+        for y in range(game_state.ARENA_SIZE):
+            if game_state.game_map.in_arena_bounds([x, y]):
+                units.extend(unit for unit in game_state.game_map[x, y] if unit.damage_i > 0 or unit.damage_f > 0)
+    return units
+
+
+class _Case:
+    """The prepared inputs of one board
+    """
+    def __init__(self, config, serialized_string):
+        self.config = config
+        self.serialized_string = serialized_string
+        self.game_state = GameState(config, serialized_string)
+        self.game_state.suppress_warnings(True)
+        self.spawn_points = _spawn_points(self.game_state)
+        self.paths = [path for path in (self.game_state.find_path_to_edge(location) for location in self.spawn_points) if path]
+        self.units = _attacking_units(self.game_state)
+        self.spawn_types = (config["unitInformation"][0]["shorthand"], config["unitInformation"][3]["shorthand"])
+        self.locations = [[x, y] for x in range(self.game_state.ARENA_SIZE) for y in range(self.game_state.ARENA_SIZE)]
+        self.game_state.clear_pathing_cache()
+
+
+def bench_game_state(case):
+    GameState(case.config, case.serialized_string)
+    return 1
+
+
+def bench_pathfinding(case):
+    game_state = case.game_state
+    game_state.clear_pathing_cache()
+    for location in case.spawn_points:
+        game_state.find_path_to_edge(location)
+    return len(case.spawn_points)
+
+
+def bench_get_attackers(case):
+    game_state = case.game_state
+    calls = 0
+    for path in case.paths:
+        for location in path:
+            game_state.get_attackers(location, 0)
+        calls += len(path)
+    return calls
+
+
+def bench_get_target(case):
+    game_state = case.game_state
+    for unit in case.units:
+        game_state.get_target(unit)
+    return len(case.units)
+
+
+def bench_get_targets(case):
+    case.game_state.get_targets(case.units)
+    return len(case.units)
+
+
+def bench_can_spawn(case):
+    game_state = case.game_state
+    structure_type, mobile_type = case.spawn_types
+    for location in case.locations:
+        game_state.can_spawn(structure_type, location)
+        game_state.can_spawn(mobile_type, location)
+    return 2 * len(case.locations)
+
+
+"""
+The benchmarks, by name. Each one runs once on a board and returns the number of operations it did
+"""
+BENCHMARKS = {
+    "game_state": bench_game_state,
+    "pathfinding": bench_pathfinding,
+    "get_attackers": bench_get_attackers,
+    "get_target": bench_get_target,
+    "get_targets": bench_get_targets,
+    "can_spawn": bench_can_spawn,
+}
+
+
+def run_benchmarks(config, boards, min_time=0.5, repeat=3, names=None):
+    """Times every benchmark over every board
+
+    Args:
+        config: The game config
+        boards: A list of (name, serialized game state) pairs
+        min_time: The number of seconds each round of a benchmark runs for at least
+        repeat: The number of rounds of each benchmark, the fastest one is kept
+        names: The benchmarks to run, every one in BENCHMARKS if None
+
+    Returns:
+        A dict mapping each benchmark name to its operations per second
+
+    """
+    cases = [_Case(config, serialized_string) for _, serialized_string in boards]
+    results = {}
+    for name in BENCHMARKS if names is None else names:
+        benchmark = BENCHMARKS[name]
+        best = 0.0
+        for _ in range(repeat):
+            operations = 0
+            start = time.perf_counter()
+            elapsed = 0.0
+            while elapsed < min_time or operations == 0:
+                for case in cases:
+                    operations += benchmark(case)
+                elapsed = time.perf_counter() - start
+                if not cases:
+                    break
+            if elapsed > 0:
+                best = max(best, operations / elapsed)
+        results[name] = best
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Compares benchmark results to a baseline
+
+    Args:
+        results: A dict mapping benchmark names to operations per second
+        baseline: A dict of the same form
+        tolerance: The fraction of the baseline speed a benchmark can lose before it counts as a regression
+
+    Returns:
+        A (lines, regressions) pair, lines describing every benchmark and regressions listing the names of the slower ones
+
+    """
+    lines = []
+    regressions = []
+    for name, ops in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            lines.append("{:<14} {:>12.1f} ops/s   (no baseline)".format(name, ops))
+            continue
+        ratio = ops / previous
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        lines.append("{:<14} {:>12.1f} ops/s   baseline {:>12.1f}   x{:.2f}{}".format(name, ops, previous, ratio, flag))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the hot paths of gamelib")
+    parser.add_argument("--replay", action="append", help="A replay file to read boards from, can be repeated. Defaults to the replays folder of the repository")
+    parser.add_argument("--baseline", help="A json file of earlier results to compare with")
+    parser.add_argument("--save", help="A json file to write the results to")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="The slowdown allowed before a benchmark counts as a regression")
+    parser.add_argument("--min-time", type=float, default=0.5, help="The number of seconds each round of a benchmark runs for")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of rounds of each benchmark, the fastest one is kept")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="A benchmark to run, can be repeated")
+    args = parser.parse_args(argv)
+
+    replay_paths = args.replay or sorted(glob.glob(DEFAULT_REPLAYS))
+    config, boards = load_boards(replay_paths)
+    if config is None:
+        print("No replay file found to read the config from, pass one with --replay")
+        return 2
+    print("Boards: {}".format(", ".join(name for name, _ in boards)))
+    results = run_benchmarks(config, boards, args.min_time, args.repeat, args.only)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            saved = json.load(baseline_file)
+        baseline = saved.get("results", {})
+        if saved.get("boards") != [name for name, _ in boards]:
+            print("The baseline was measured on other boards, the comparison may not be meaningful")
+    lines, regressions = compare(results, baseline, args.tolerance)
+    print("\n".join(lines))
+    if args.save:
+        with open(args.save, "w") as save_file:
+            json.dump({"boards": [name for name, _ in boards], "results": results}, save_file, indent=2)
+    if regressions:
+        print("Slower than the baseline: {}".format(", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
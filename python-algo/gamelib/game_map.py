@@ -1,7 +1,115 @@
+import copy
 import math
 from .unit import GameUnit
 from .util import debug_write
 
+
+def _row_bounds(y, arena_size):
+    half_board = arena_size // 2
+    row_size = y + 1 if y < half_board else arena_size - y
+    startx = half_board - row_size
+    return startx, startx + (2 * row_size) - 1
+
+
+"""
+Precomputed arena shape. Bitmasks use bit x * 28 + y for location [x, y].
+"""
+ROW_BOUNDS = {y: _row_bounds(y, 28) for y in range(28)}
+ARENA_MASK = sum(1 << (x * 28 + y) for y, (startx, endx) in ROW_BOUNDS.items() for x in range(startx, endx + 1))
+
+def _edges(arena_size):
+    half_arena = arena_size // 2
+    top_right = tuple([half_arena + num, arena_size - 1 - num] for num in range(half_arena))
+    top_left = tuple([half_arena - 1 - num, arena_size - 1 - num] for num in range(half_arena))
+    bottom_left = tuple([half_arena - 1 - num, num] for num in range(half_arena))
+    bottom_right = tuple([half_arena + num, num] for num in range(half_arena))
+    return (top_right, top_left, bottom_left, bottom_right)
+
+
+"""
+The locations of the four edges, in the order of get_edges, and the bitmask of each edge.
+Shared by every GameMap and used as is inside gamelib, so they must not be modified. get_edges and
+get_edge_locations return copies.
+"""
+EDGES = _edges(28)
+EDGE_MASKS = tuple(sum(1 << (x * 28 + y) for x, y in edge) for edge in EDGES)
+ALL_EDGES_MASK = EDGE_MASKS[0] | EDGE_MASKS[1] | EDGE_MASKS[2] | EDGE_MASKS[3]
+_QUADRANTS = (0, 1, 2, 3)
+
+"""
+Range tables shared by every GameMap, keyed by (radius, getHitRadius) so each
+game config gets its own entries. The offsets are in the same order as the
+square scan get_locations_in_range used to do.
+"""
+_RANGE_OFFSETS = {}
+_RANGE_LOCATIONS = {}
+_RANGE_ROWS = {}
+
+
+def range_offsets(radius, hit_radius):
+    """Gets the offsets [dx, dy] of every tile whose center is within radius + hit_radius of the origin
+
+    Returns:
+        A tuple of (dx, dy, distance) tuples
+
+    """
+    key = (radius, hit_radius)
+    offsets = _RANGE_OFFSETS.get(key)
+    if offsets is None:
+        search_radius = math.ceil(radius)
+        offsets = []
+        for dx in range(-search_radius, search_radius + 1):
+            for dy in range(-search_radius, search_radius + 1):
+                distance = math.sqrt(dx ** 2 + dy ** 2)
+                if distance < radius + hit_radius:
+                    offsets.append((dx, dy, distance))
+        offsets = tuple(offsets)
+        _RANGE_OFFSETS[key] = offsets
+    return offsets
+
+
+def range_rows(radius, hit_radius):
+    """Gets the extent of every row of the range around the origin
+
+    Returns:
+        A tuple of (dy, dx) pairs, in increasing dy order, where the offsets [-dx, dy] to [dx, dy] are in range
+
+    """
+    key = (radius, hit_radius)
+    rows = _RANGE_ROWS.get(key)
+    if rows is None:
+        widths = {}
+        for dx, dy, _ in range_offsets(radius, hit_radius):
+            widths[dy] = max(widths.get(dy, dx), dx)
+        rows = _RANGE_ROWS[key] = tuple(sorted(widths.items()))
+    return rows
+
+
+def range_locations(x, y, radius, hit_radius):
+    """Gets the in arena locations within range of the integer location [x, y], cached per location
+
+    Returns:
+        A tuple of (x, y) tuples
+
+    """
+    key = (radius, hit_radius)
+    by_location = _RANGE_LOCATIONS.get(key)
+    if by_location is None:
+        by_location = _RANGE_LOCATIONS[key] = {}
+    in_grid = 0 <= x < 28 and 0 <= y < 28
+    locations = by_location.get(x * 28 + y) if in_grid else None
+    if locations is None:
+        locations = []
+        for dx, dy, _ in range_offsets(radius, hit_radius):
+            bounds = ROW_BOUNDS.get(y + dy)
+            if bounds is not None and bounds[0] <= x + dx <= bounds[1]:
+                locations.append((x + dx, y + dy))
+        locations = tuple(locations)
+        if in_grid:
+            by_location[x * 28 + y] = locations
+    return locations
+
+
 class GameMap:
     """Holds data about the current game map and provides functions
     useful for getting information related to the map.
@@ -19,6 +127,23 @@ class GameMap:
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
 
+    The map also keeps bitmasks of the structures on the board, with bit x * ARENA_SIZE + y
+    set for location [x, y]. They answer occupancy queries without looking at GameUnit lists
+    and are what the pathfinder keys its cache on. Mobile units get the same kind of bitmask per
+    player, along with their count at every location, so range queries only visit occupied
+    locations. add_unit, remove_unit and item assignment keep them up to date. Units appended to
+    or removed from a list read with game_map[x, y] are picked up the next time a bitmask is read.
+    Edits that keep the length of the list, such as replacing a unit, need update_masks(location).
+
+    fork() makes a cheap copy of the map for hypothetical edits. The copy shares every
+    location with the original until one side edits it, at which point the edited location
+    alone is copied. checkpoint() and rollback() undo in place edits. Both only see edits made
+    through add_unit, remove_unit, item assignment and the unit lists returned by edit_location.
+
+    A map loaded from a UnitStore with load_store makes the GameUnits of a location the first
+    time the location is read. The bitmasks come from the store, so occupancy queries and
+    pathing never make GameUnits.
+
     """
     def __init__(self, config):
         """Initializes constants and game map
@@ -37,16 +162,194 @@ class GameMap:
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
         self.__start = [13,0]
+        self.__blocked_mask = 0
+        self.__structure_masks = [0, 0]
+        self.__type_masks = [{}, {}]
+        self.__mobile_masks = [0, 0]
+        #__mobile_counts[player_index] maps x * ARENA_SIZE + y to the number of mobile units of the player at [x, y]
+        self.__mobile_counts = [{}, {}]
+        self._threat_map = None
+        #__shared[x * ARENA_SIZE + y] is 1 while the unit list of [x, y] may be shared with a fork, None if nothing is shared
+        self.__shared = None
+        self.__undo_log = []
+        self.__checkpoints = []
+        self.__store = None
+        #__unbuilt[x * ARENA_SIZE + y] is 1 while the GameUnits of [x, y] are only in the store, None without a store
+        self.__unbuilt = None
+        #__handed_out maps x * ARENA_SIZE + y to the length the unit list of [x, y] had when game_map[x, y]
+        #first returned it since its masks were last updated
+        self.__handed_out = {}
+        self.__warm_range_tables()
+
+    def load_store(self, store):
+        """Fills an empty map from a UnitStore. GameUnits are only made when a location is read.
+
+        Args:
+            store: A UnitStore
+
+        """
+        self.__store = store
+        self.__unbuilt = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        for index in store.occupied():
+            self.__unbuilt[index] = 1
+        self.__structure_masks = list(store.structure_masks)
+        self.__type_masks = [dict(type_masks) for type_masks in store.type_masks]
+        self.__mobile_masks = list(store.mobile_masks)
+        self.__mobile_counts = [dict(counts) for counts in store.mobile_counts]
+        self.__blocked_mask = self.__structure_masks[0] | self.__structure_masks[1]
+
+    def __units(self, x, y):
+        """Gets the unit list of [x, y], making its GameUnits from the store on first use
+        """
+        if self.__unbuilt is not None:
+            index = x * self.ARENA_SIZE + y
+            if self.__unbuilt[index]:
+                self.__unbuilt[index] = 0
+                store = self.__store
+                self.__map[x][y] = [store.make_unit(row) for row in store.rows_at([x, y])]
+                if self.__shared is not None:
+                    self.__shared[index] = 0
+        return self.__map[x][y]
+
+    def fork(self):
+        """Makes a copy of this map that shares its unit lists until either map edits them
+
+        Returns:
+            A new GameMap with the same units, masks and threat map. Edits made to either
+            map afterwards through add_unit, remove_unit, item assignment or edit_location
+            do not show up in the other one.
+
+        """
+        self._sync_masks()
+        forked = GameMap.__new__(GameMap)
+        forked.__dict__.update(self.__dict__)
+        forked.__handed_out = {}
+        forked.__map = [list(column) for column in self.__map]
+        forked.__structure_masks = list(self.__structure_masks)
+        forked.__type_masks = [dict(type_masks) for type_masks in self.__type_masks]
+        forked.__mobile_masks = list(self.__mobile_masks)
+        forked.__mobile_counts = [dict(counts) for counts in self.__mobile_counts]
+        forked.__shared = bytearray(b"\x01") * (self.ARENA_SIZE * self.ARENA_SIZE)
+        forked.__unbuilt = None if self.__unbuilt is None else bytearray(self.__unbuilt)
+        forked.__undo_log = []
+        forked.__checkpoints = []
+        forked._threat_map = None if self._threat_map is None else self._threat_map.fork(forked)
+        self.__shared = bytearray(forked.__shared)
+        return forked
+
+    def checkpoint(self):
+        """Starts recording edits so they can be undone with rollback. Checkpoints can be nested.
+
+        Returns:
+            The number of open checkpoints, including the new one
+
+        """
+        self.__checkpoints.append((len(self.__undo_log), set()))
+        return len(self.__checkpoints)
+
+    def rollback(self):
+        """Undoes every edit made since the latest checkpoint and closes it
+        """
+        if not self.__checkpoints:
+            self.warn("rollback was called without an open checkpoint")
+            return
+        log_length, _ = self.__checkpoints.pop()
+        while len(self.__undo_log) > log_length:
+            x, y, units, shared = self.__undo_log.pop()
+            self.__map[x][y] = units
+            if shared:
+                self.__shared[x * self.ARENA_SIZE + y] = 1
+            self.update_masks([x, y])
+
+    def commit(self):
+        """Closes the latest checkpoint, keeping its edits. They can still be undone by an enclosing checkpoint
+        """
+        if not self.__checkpoints:
+            self.warn("commit was called without an open checkpoint")
+            return
+        self.__checkpoints.pop()
+        if not self.__checkpoints:
+            self.__undo_log = []
+
+    def edit_location(self, location):
+        """Gets the unit list of a location to edit it or its units in place, for instance to upgrade a unit.
+        On a forked map, or with an open checkpoint, the list and its units are copied first so the
+        edit does not leak into other maps and can be undone. Call update_masks(location) after the edit.
+
+        Args:
+            location: A map location
+
+        Returns:
+            The unit list of the location, safe to edit
+
+        """
+        x, y = location
+        return self.__own_location(x, y, True)
+
+    def __own_location(self, x, y, copy_units):
+        """Makes sure the unit list of [x, y] belongs to this map alone and is recorded for rollback
+        """
+        index = x * self.ARENA_SIZE + y
+        units = self.__units(x, y)
+        shared = self.__shared is not None and self.__shared[index]
+        logged = False
+        if self.__checkpoints:
+            saved = self.__checkpoints[-1][1]
+            if index not in saved:
+                saved.add(index)
+                self.__undo_log.append((x, y, units, shared))
+                logged = True
+        if shared or logged:
+            if shared:
+                self.__shared[index] = 0
+            if copy_units:
+                units = [copy.copy(unit) for unit in units]
+                self.__map[x][y] = units
+        return units
     
+    def __warm_range_tables(self):
+        """Precomputes the range offsets of every attack and shield range in the config, upgrades included
+        """
+        unit_information = self.config.get("unitInformation", [])
+        if not unit_information or 'getHitRadius' not in unit_information[0]:
+            return
+        hit_radius = unit_information[0]['getHitRadius']
+        for unit in unit_information:
+            for stats in (unit, unit.get("upgrade", {})):
+                for key in ("attackRange", "shieldRange", "selfDestructRange"):
+                    if key in stats:
+                        range_offsets(stats[key], hit_radius)
+
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
             x,y = location
-            return self.__map[x][y]
+            units = self.__units(x, y)
+            self.__handed_out.setdefault(x * self.ARENA_SIZE + y, len(units))
+            return units
         self._invalid_coordinates(location)
 
+    def _units_at(self, x, y):
+        """Gets the unit list of [x, y] like game_map[x, y], for gamelib code that only reads it
+        """
+        return self.__units(x, y)
+
+    def _sync_masks(self):
+        """Updates the masks of the locations whose unit list changed length since game_map[x, y] returned it
+        """
+        if not self.__handed_out:
+            return
+        handed_out = self.__handed_out
+        self.__handed_out = {}
+        for index, length in handed_out.items():
+            x, y = divmod(index, self.ARENA_SIZE)
+            if len(self.__map[x][y]) != length:
+                self.update_masks([x, y])
+
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
+            self.__own_location(location[0], location[1], False)
             self.__map[location[0]][location[1]] = val
+            self.update_masks(location)
             return
         self._invalid_coordinates(location)
 
@@ -68,12 +371,7 @@ class GameMap:
         return location 
 
     def __empty_grid(self):
-        grid = []
-        for x in range(0, self.ARENA_SIZE):
-            grid.append([])
-            for _ in range(0, self.ARENA_SIZE):
-                grid[x].append([])
-        return grid
+        return [[[] for _ in range(self.ARENA_SIZE)] for _ in range(self.ARENA_SIZE)]
 
     def _invalid_coordinates(self, location):
         self.warn("{} is out of bounds.".format(str(location)))
@@ -89,6 +387,9 @@ class GameMap:
         
         """
         x, y = location
+        bounds = ROW_BOUNDS.get(y)
+        if bounds is not None:
+            return bounds[0] <= x <= bounds[1]
         half_board = self.HALF_ARENA
 
         row_size = y + 1
@@ -113,12 +414,11 @@ class GameMap:
             A list of locations along the requested edge
 
         """
-        if not quadrant_description in [self.TOP_LEFT, self.TOP_RIGHT, self.BOTTOM_LEFT, self.BOTTOM_RIGHT]:
+        if not quadrant_description in _QUADRANTS:
             self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [list(location) for location in EDGES[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,27 +427,39 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[list(location) for location in edge] for edge in EDGES]
+
+    def get_edge_mask(self, quadrant_description=None):
+        """Gets a bitmask of the locations of an edge
+
+        Args:
+            quadrant_description: A constant corresponding to one of the 4 edges, see get_edge_locations. Every edge if None.
+
+        Returns:
+            An int with bit x * ARENA_SIZE + y set for every location [x, y] of the edge
+
+        """
+        if quadrant_description is None:
+            return ALL_EDGES_MASK
+        if not quadrant_description in _QUADRANTS:
+            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_mask.".format(quadrant_description))
+            return 0
+        return EDGE_MASKS[quadrant_description]
+
+    def is_on_edge(self, location, quadrant_description=None):
+        """Checks if a location is on an edge, without going through the edge locations
+
+        Args:
+            location: A map location
+            quadrant_description: A constant corresponding to one of the 4 edges, see get_edge_locations. Any edge if None.
+
+        Returns:
+            True if the location is on the edge, False otherwise
+
+        """
+        if not self.in_arena_bounds(location):
+            return False
+        return (self.get_edge_mask(quadrant_description) >> (location[0] * self.ARENA_SIZE + location[1])) & 1 == 1
     
     def add_unit(self, unit_type, location, player_index=0):
         """Add a single GameUnit to the map at the given location.
@@ -169,9 +481,16 @@ class GameMap:
         x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
         if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+            self.__own_location(x, y, True).append(new_unit)
+            if player_index == 0 or player_index == 1:
+                index = x * self.ARENA_SIZE + y
+                counts = self.__mobile_counts[player_index]
+                counts[index] = counts.get(index, 0) + 1
+                self.__mobile_masks[player_index] |= 1 << index
         else:
+            self.__own_location(x, y, False)
             self.__map[x][y] = [new_unit]
+            self.update_masks(location)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -186,14 +505,188 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
+        self.__own_location(x, y, False)
         self.__map[x][y] = []
+        self.update_masks(location)
+
+    def update_masks(self, location):
+        """Recomputes the structure bitmasks and mobile unit counts of a location from its unit list,
+        along with the threat map attached to this map if there is one.
+
+        Args:
+            location: The location whose unit list changed
+
+        add_unit, remove_unit and item assignment call this for you. Call it yourself after
+        editing the unit list of a location directly.
+        """
+        x, y = location
+        bit = 1 << (x * self.ARENA_SIZE + y)
+        self.__handed_out.pop(x * self.ARENA_SIZE + y, None)
+        if self.__blocked_mask & bit:
+            cleared = ~bit
+            self.__blocked_mask &= cleared
+            for player_index in (0, 1):
+                self.__structure_masks[player_index] &= cleared
+                type_masks = self.__type_masks[player_index]
+                for unit_type in type_masks:
+                    type_masks[unit_type] &= cleared
+        index = x * self.ARENA_SIZE + y
+        for player_index in (0, 1):
+            if self.__mobile_masks[player_index] & bit:
+                self.__mobile_masks[player_index] &= ~bit
+                del self.__mobile_counts[player_index][index]
+
+        for unit in self.__units(x, y):
+            if unit.stationary:
+                self.__blocked_mask |= bit
+                if unit.player_index == 0 or unit.player_index == 1:
+                    self.__structure_masks[unit.player_index] |= bit
+                    type_masks = self.__type_masks[unit.player_index]
+                    type_masks[unit.unit_type] = type_masks.get(unit.unit_type, 0) | bit
+            elif unit.player_index == 0 or unit.player_index == 1:
+                counts = self.__mobile_counts[unit.player_index]
+                counts[index] = counts.get(index, 0) + 1
+                self.__mobile_masks[unit.player_index] |= bit
+
+        if self._threat_map is not None:
+            self._threat_map.update_location(location)
+
+    def get_structure_mask(self, player_index=None):
+        """Gets a bitmask of the locations holding a structure
+
+        Args:
+            player_index: Only count structures of this player, 0 for you 1 for the enemy. Any player if None.
+
+        Returns:
+            An int with bit x * ARENA_SIZE + y set for every matching location [x, y]
+
+        """
+        if self.__handed_out:
+            self._sync_masks()
+        if player_index is None:
+            return self.__blocked_mask
+        return self.__structure_masks[player_index]
+
+    def get_type_mask(self, unit_type, player_index=None):
+        """Gets a bitmask of the locations holding a structure of the given type
+
+        Args:
+            unit_type: A structure type, WALL, TURRET, etc.
+            player_index: Only count structures of this player, 0 for you 1 for the enemy. Any player if None.
+
+        Returns:
+            An int with bit x * ARENA_SIZE + y set for every matching location [x, y]
+
+        """
+        if self.__handed_out:
+            self._sync_masks()
+        if player_index is None:
+            return self.__type_masks[0].get(unit_type, 0) | self.__type_masks[1].get(unit_type, 0)
+        return self.__type_masks[player_index].get(unit_type, 0)
+
+    def get_mobile_mask(self, player_index=None):
+        """Gets a bitmask of the locations holding at least one mobile unit
+
+        Args:
+            player_index: Only count mobile units of this player, 0 for you 1 for the enemy. Any player if None.
+
+        Returns:
+            An int with bit x * ARENA_SIZE + y set for every matching location [x, y]
+
+        """
+        if self.__handed_out:
+            self._sync_masks()
+        if player_index is None:
+            return self.__mobile_masks[0] | self.__mobile_masks[1]
+        return self.__mobile_masks[player_index]
+
+    def get_mobile_count(self, location, player_index=None):
+        """Counts the mobile units at a location, without looking at its units
+
+        Args:
+            location: A map location
+            player_index: Only count mobile units of this player, 0 for you 1 for the enemy. Any player if None.
+
+        Returns:
+            The number of matching mobile units at the location
+
+        """
+        if self.__handed_out:
+            self._sync_masks()
+        index = location[0] * self.ARENA_SIZE + location[1]
+        if player_index is None:
+            return self.__mobile_counts[0].get(index, 0) + self.__mobile_counts[1].get(index, 0)
+        return self.__mobile_counts[player_index].get(index, 0)
+
+    def get_occupied_mask(self, player_index=None):
+        """Gets a bitmask of the locations holding at least one unit, structure or mobile
+
+        Args:
+            player_index: Only count units of this player, 0 for you 1 for the enemy. Any player if None.
+
+        Returns:
+            An int with bit x * ARENA_SIZE + y set for every matching location [x, y]
+
+        """
+        return self.get_structure_mask(player_index) | self.get_mobile_mask(player_index)
+
+    def contains_structure(self, location, unit_type=None, player_index=None):
+        """Checks the structure bitmasks for a location
+
+        Args:
+            location: A map location
+            unit_type: Only match structures of this type. Any type if None.
+            player_index: Only match structures of this player, 0 for you 1 for the enemy. Any player if None.
+
+        Returns:
+            True if a matching structure is at the location, False otherwise
+
+        """
+        if not self.in_arena_bounds(location):
+            return False
+        if unit_type is None:
+            mask = self.get_structure_mask(player_index)
+        else:
+            mask = self.get_type_mask(unit_type, player_index)
+        return (mask >> (location[0] * self.ARENA_SIZE + location[1])) & 1 == 1
+
+    def is_blocked(self, location):
+        """Checks if a structure blocks a location, without looking at its units
 
-    def get_locations_in_range(self, location, radius):
+        Args:
+            location: A map location
+
+        Returns:
+            True if the location is in the arena and holds a structure, False otherwise
+
+        """
+        return self.contains_structure(location)
+
+    def mask_to_locations(self, mask):
+        """Lists the locations whose bits are set in a bitmask
+
+        Args:
+            mask: A bitmask such as the ones returned by get_structure_mask
+
+        Returns:
+            A list of [x, y] locations, ordered by x then y
+
+        """
+        locations = []
+        while mask:
+            lowest = mask & -mask
+            x, y = divmod(lowest.bit_length() - 1, self.ARENA_SIZE)
+            locations.append([x, y])
+            mask ^= lowest
+        return locations
+
+    def get_locations_in_range(self, location, radius, mask=None):
         """Gets locations in a circular area around a location
 
         Args:
             location: The center of our search area
             radius: The radius of our search area
+            mask: Only keep the locations whose bit is set in this bitmask, such as one from get_occupied_mask. Every location if None.
 
         Returns:
             The locations that are within our search area
@@ -205,15 +698,21 @@ class GameMap:
             self._invalid_coordinates(location)
 
         x, y = location
+        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
+        if type(x) == int and type(y) == int:
+            if mask is None:
+                return [[i, j] for i, j in range_locations(x, y, radius, getHitRadius)]
+            return [[i, j] for i, j in range_locations(x, y, radius, getHitRadius) if (mask >> (i * self.ARENA_SIZE + j)) & 1]
+
         locations = []
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
         for i in range(int(x - search_radius), int(x + search_radius + 1)):
             for j in range(int(y - search_radius), int(y + search_radius + 1)):
                 new_location = [i, j]
                 # A unit with a given range affects all locations who's centers are within that range + get hit radius
                 if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
-                    locations.append(new_location)
+                    if mask is None or (mask >> (i * self.ARENA_SIZE + j)) & 1:
+                        locations.append(new_location)
         return locations
 
     def distance_between_locations(self, location_1, location_2):
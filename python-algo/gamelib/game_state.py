@@ -1,11 +1,26 @@
+import copy
 import math
 import json
 import sys
+from bisect import bisect_left, bisect_right
 
 from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
+from .util import send_command, debug_write, decode
 from .unit import GameUnit
-from .game_map import GameMap
+from .unit_store import UnitStore
+from .game_map import GameMap, EDGES, range_rows
+from .threat_map import ThreatMap
+from .resource_forecast import bit_cap
+
+def _count_affordable(costs, resources):
+    """Number of units costing costs that resources can pay for, None if the units are free
+    """
+    affordable = None
+    for resource in (SP, MP):
+        if costs[resource] > 0:
+            count = math.floor(resources[resource] / costs[resource])
+            affordable = count if affordable is None else min(affordable, count)
+    return affordable
 
 def is_stationary(unit_type):
     """
@@ -38,7 +53,10 @@ class GameState:
         * MP (int): A constant representing the Mobile Points resource, used in the get_resource function
         * SP (int): A constant representing the SP resource, used in the get_resource function
          
+        * serialized_string (string or dict): The game state this object was built from, as given to the constructor:
+          the json string sent by the engine, or the dict it decodes to, as AlgoCore passes for action frames
         * game_map (:obj: GameMap): The current GameMap. To retrieve a list of GameUnits at a location, use game_map[x, y]
+        * unit_store (:obj: UnitStore): The units as columns when parsed with lazy_units, None otherwise
         * turn_number (int): The current turn number. Starts at 0.
         * my_health (int): Your current remaining health
         * my_time (int): The time you took to submit your previous turn
@@ -47,18 +65,27 @@ class GameState:
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, lazy_units=False):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn,
+              or the dict it decodes to
+            * lazy_units (bool): If True, the units are read into a UnitStore and the GameUnits of a location
+              are only made when game_map reads that location. Useful for action frames.
 
         """
         self.serialized_string = serialized_string
         self.config = config
         self.enable_warnings = True
+        self._lazy_units = lazy_units
+        self._set_unit_constants(config)
+        self._build_state(serialized_string)
 
+    def _set_unit_constants(self, config):
+        """Sets the unit type constants of this module and the arena constants of this game state from the config
+        """
         global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
         UNIT_TYPE_TO_INDEX = {}
         WALL = config["unitInformation"][0]["shorthand"]
@@ -89,10 +116,16 @@ class GameState:
         MP = self.MP
         SP = self.SP
 
+    def _build_state(self, serialized_string):
+        """Builds the map, resources and command stacks from the serialized game state
+        """
+        self.unit_store = None
         self.game_map = GameMap(self.config)
+        self.game_map.enable_warnings = self.enable_warnings
         self._shortest_path_finder = ShortestPathFinder()
         self._build_stack = []
         self._deploy_stack = []
+        self._checkpoints = []
         self._player_resources = [
                 {'SP': 0, 'MP': 0},  # player 0, which is you
                 {'SP': 0, 'MP': 0}]  # player 1, which is the opponent
@@ -101,9 +134,9 @@ class GameState:
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, or the dict it decodes to.
         """
-        state = json.loads(state_line)
+        state = decode(state_line) if isinstance(state_line, str) else state_line
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -123,6 +156,10 @@ class GameState:
         p1units = state["p1Units"]
         p2units = state["p2Units"]
 
+        if self._lazy_units:
+            self.unit_store = UnitStore(self.config, p1units, p2units)
+            self.game_map.load_store(self.unit_store)
+            return
         self.__create_parsed_units(p1units, 0)
         self.__create_parsed_units(p2units, 1)
 
@@ -131,6 +168,7 @@ class GameState:
         Helper function for __parse_state to add units to the map.
         """
         typedef = self.config.get("unitInformation")
+        mobile_locations = set()
         for i, unit_types in enumerate(units):
             for uinfo in unit_types:
                 unit_type = typedef[i].get("shorthand")
@@ -141,13 +179,19 @@ class GameState:
                 if unit_type == REMOVE:
                     # Quick fix will deploy engine fix soon
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].pending_removal = True
+                        self.game_map._units_at(x, y)[0].pending_removal = True
                 elif unit_type == UPGRADE:
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].upgrade()
+                        self.game_map._units_at(x, y)[0].upgrade()
                 else:
                     unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    self.game_map.edit_location([x, y]).append(unit)
+                    if unit.stationary:
+                        self.game_map.update_masks([x,y])
+                    else:
+                        mobile_locations.add((x, y))
+        for x, y in mobile_locations:
+            self.game_map.update_masks([x, y])
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -171,6 +215,51 @@ class GameState:
     def _invalid_unit(self, unit):
         self.warn("Invalid unit {}".format(unit))
 
+    def clone(self):
+        """Makes a cheap copy of this game state for hypothetical moves.
+        The copy gets a forked game map (see GameMap.fork), its own resources and command stacks,
+        and shares the pathing cache, which is keyed by structure layout.
+
+        Returns:
+            A new GameState. attempt_spawn, attempt_upgrade and attempt_remove on it leave this one untouched.
+
+        """
+        cloned = copy.copy(self)
+        cloned.game_map = self.game_map.fork()
+        cloned._player_resources = [dict(resources) for resources in self._player_resources]
+        cloned._build_stack = list(self._build_stack)
+        cloned._deploy_stack = list(self._deploy_stack)
+        cloned._checkpoints = []
+        return cloned
+
+    def checkpoint(self):
+        """Starts recording moves so they can be undone with rollback. Checkpoints can be nested.
+        Records the resources, the command stacks and, through GameMap.checkpoint, the map.
+        """
+        self._checkpoints.append(([dict(resources) for resources in self._player_resources],
+                                  len(self._build_stack), len(self._deploy_stack)))
+        self.game_map.checkpoint()
+
+    def rollback(self):
+        """Undoes every move made since the latest checkpoint and closes it
+        """
+        if not self._checkpoints:
+            self.warn("rollback was called without an open checkpoint")
+            return
+        self._player_resources, build_length, deploy_length = self._checkpoints.pop()
+        del self._build_stack[build_length:]
+        del self._deploy_stack[deploy_length:]
+        self.game_map.rollback()
+
+    def commit(self):
+        """Closes the latest checkpoint, keeping its moves
+        """
+        if not self._checkpoints:
+            self.warn("commit was called without an open checkpoint")
+            return
+        self._checkpoints.pop()
+        self.game_map.commit()
+
     def submit_turn(self):
         """Submit and end your turn.
             Must be called at the end of your turn or the algo will hang.
@@ -238,17 +327,11 @@ class GameState:
             self._invalid_unit(unit_type)
             return
 
-        costs = self.type_cost(unit_type)
-        player_held = self.get_resources()
-        if costs[MP] > 0 and costs[SP] > 0:
-            return min(math.floor(player_held[SP] / costs[SP]), math.floor(player_held[MP] / costs[MP]))
-        elif costs[MP] > 0:
-            return math.floor(player_held[MP] / costs[MP])
-        elif costs[SP] > 0:
-            return math.floor(player_held[SP] / costs[SP])
-        else:
+        affordable = _count_affordable(self.type_cost(unit_type), self.get_resources())
+        if affordable is None:
             self.warn("Invalid costs for unit, cost is 0 for both resources, returning 0")
             return 0
+        return affordable
 
     def project_future_MP(self, turns_in_future=1, player_index=0, current_MP=None):
         """Predicts the number of MP we will have on a future turn
@@ -259,7 +342,7 @@ class GameState:
             current_MP: If we pass a value here, we will use that value instead of the current MP of the given player.
 
         Returns:
-            The number of MP the given player will have after the given number of turns
+            The number of MP the given player will have after the given number of turns, capped at maxBits
 
         """
 
@@ -271,15 +354,19 @@ class GameState:
             self.warn("Invalid current MP ({}). Current MP cannot be negative.".format(current_MP))
 
         MP = self.get_resource(self.MP, player_index) if not current_MP else current_MP
+        resources_config = self.config["resources"]
+        MP_kept = 1 - resources_config["bitDecayPerRound"]
+        MP_per_round = resources_config["bitsPerRound"]
+        MP_ramp_interval = resources_config["turnIntervalForBitSchedule"]
+        MP_per_round_growth = resources_config["bitGrowthRate"]
+        max_MP = bit_cap(self.config)
         for increment in range(1, turns_in_future + 1):
             current_turn = self.turn_number + increment
-            MP *= (1 - self.config["resources"]["bitDecayPerRound"])
-            MP_per_round = self.config["resources"]["bitsPerRound"]
-            MP_ramp_ups = current_turn // self.config["resources"]["turnIntervalForBitSchedule"]
-            MP_per_round_growth = self.config["resources"]["bitGrowthRate"]
+            MP *= MP_kept
+            MP_ramp_ups = current_turn // MP_ramp_interval
             MP_gained = MP_per_round + (MP_per_round_growth * MP_ramp_ups)
             MP += MP_gained
-            MP = round(MP, 1)
+            MP = min(round(MP, 1), max_MP)
         return MP
 
     def type_cost(self, unit_type, upgrade=False):
@@ -309,7 +396,8 @@ class GameState:
 
         To units, we need to be able to afford them, and the location must be
         in bounds, unblocked, on our side of the map, not on top of a unit we can't stack with, 
-        and on an edge if the unit is mobile.
+        and on an edge if the unit is mobile. Warns with the reasons when we can't, and like
+        number_affordable when the unit costs nothing.
 
         Args:
             unit_type: The type of the unit
@@ -324,33 +412,59 @@ class GameState:
             self._invalid_unit(unit_type)
             return
         
+        reasons = self.__spawn_check(unit_type, location, num, self.get_resources())[1]
+        if reasons and self.enable_warnings:
+            self.warn("Could not spawn {} at location {}. {}".format(unit_type, location, " ".join(reasons)))
+        return not reasons
+
+    def __spawn_check(self, unit_type, location, num, resources, planned_structures=(), planned_mobile=()):
+        """Checks whether units of a valid type can be spawned. The only warning is the one of
+        number_affordable when the unit costs nothing, the reasons are left to the caller.
+
+        Args:
+            unit_type, location, num: See can_spawn
+            resources: The [SP, MP] left to pay for the units
+            planned_structures: The location indices x * ARENA_SIZE + y of structures about to be spawned, mapped to their types
+            planned_mobile: The location indices of mobile units about to be spawned
+
+        Returns:
+            A (count, reasons) tuple, where count is the number of units that can be spawned and
+            reasons lists why not all num of them can, empty if they all can
+
+        """
         if not self.game_map.in_arena_bounds(location):
-            if self.enable_warnings:
-                self.warn("Could not spawn {} at location {}. Location invalid.".format(unit_type, location))
-            return False
+            return 0, ["Location invalid."]
+        if num < 1:
+            return 0, ["Cannot spawn fewer than one unit."]
 
-        affordable = self.number_affordable(unit_type) >= num
+        x, y = map(int, location)
+        index = x * self.ARENA_SIZE + y
         stationary = is_stationary(unit_type)
-        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
-        correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
-
-        if self.enable_warnings:
-            fail_reason = ""
-            if not affordable:
-                fail_reason = fail_reason + " Not enough resources."
-            if blocked:
-                fail_reason = fail_reason + " Location is blocked."
-            if not correct_territory:
-                fail_reason = fail_reason + " Location in enemy territory."
-            if not (stationary or on_edge):
-                fail_reason = fail_reason + " Information units must be deployed on the edge."
-            if len(fail_reason) > 0:
-                self.warn("Could not spawn {} at location {}.{}".format(unit_type, location, fail_reason))
-
-        return (affordable and correct_territory and not blocked and
-                (stationary or on_edge) and
-                (not stationary or num == 1))
+        wanted = 1 if stationary else num
+        affordable = _count_affordable(self.type_cost(unit_type), resources)
+        if affordable is None:
+            self.warn("Invalid costs for unit, cost is 0 for both resources, returning 0")
+            affordable = 0
+        has_structure = (self.game_map.get_structure_mask() >> index) & 1 or index in planned_structures
+        blocked = has_structure or (stationary and (index in planned_mobile or len(self.game_map._units_at(x, y)) > 0))
+        correct_territory = y < self.HALF_ARENA
+        edge_mask = self.game_map.get_edge_mask(self.game_map.BOTTOM_LEFT) | self.game_map.get_edge_mask(self.game_map.BOTTOM_RIGHT)
+        on_edge = (edge_mask >> index) & 1 == 1
+
+        reasons = []
+        if affordable < wanted:
+            reasons.append("Not enough resources.")
+        if blocked:
+            reasons.append("Location is blocked.")
+        if not correct_territory:
+            reasons.append("Location in enemy territory.")
+        if not (stationary or on_edge):
+            reasons.append("Information units must be deployed on the edge.")
+        if wanted < num:
+            reasons.append("Only one structure fits in a location.")
+        if blocked or not correct_territory or not (stationary or on_edge):
+            return 0, reasons
+        return min(wanted, affordable), reasons
 
     def attempt_spawn(self, unit_type, locations, num=1):
         """Attempts to spawn new units with the type given in the given locations.
@@ -373,24 +487,34 @@ class GameState:
       
         if type(locations[0]) == int:
             locations = [locations]
+        stationary = is_stationary(unit_type)
+        costs = self.type_cost(unit_type)
         spawned_units = 0
         for location in locations:
-            for i in range(num):
-                if self.can_spawn(unit_type, location, 1):
-                    x, y = map(int, location)
-                    costs = self.type_cost(unit_type)
-                    self.__set_resource(SP, 0 - costs[SP])
-                    self.__set_resource(MP, 0 - costs[MP])
-                    self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
-                    else:
-                        self._deploy_stack.append((unit_type, x, y))
-                    spawned_units += 1
-                else:
-                    break
+            if not self.can_spawn(unit_type, location, 1):
+                continue
+            #Once the first unit fits, only the resources limit how many more can join it
+            count = 1 if stationary else min(num, self.number_affordable(unit_type))
+            x, y = map(int, location)
+            self.__set_resource(SP, 0 - costs[SP] * count)
+            self.__set_resource(MP, 0 - costs[MP] * count)
+            self.__add_units(unit_type, x, y, count)
+            spawned_units += count
+            if count < num:
+                self.warn("Could not spawn {} at location {}. {}".format(
+                    unit_type, location, "Location is blocked." if stationary else "Not enough resources."))
         return spawned_units
 
+    def __add_units(self, unit_type, x, y, count):
+        """Adds count new units of ours to the map and the command stacks, without checks or costs
+        """
+        for _ in range(count):
+            self.game_map.add_unit(unit_type, [x, y], 0)
+        if is_stationary(unit_type):
+            self._build_stack.extend([(unit_type, x, y)] * count)
+        else:
+            self._deploy_stack.extend([(unit_type, x, y)] * count)
+
     def attempt_remove(self, locations):
         """Attempts to remove existing friendly structures in the given locations.
 
@@ -428,26 +552,152 @@ class GameState:
             locations = [locations]
         spawned_units = 0
         for location in locations:
-            if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
-                x, y = map(int, location)
-                existing_unit = None
-                for unit in self.game_map[x, y]:
-                    if unit.stationary:
-                        existing_unit = unit
-
-                if not existing_unit.upgraded and self.config["unitInformation"][UNIT_TYPE_TO_INDEX[existing_unit.unit_type]].get("upgrade", None) is not None:
-                    costs = self.type_cost(existing_unit.unit_type, True)
-                    resources = self.get_resources()
-                    if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
-                        self.__set_resource(SP, 0 - costs[SP])
-                        self.__set_resource(MP, 0 - costs[MP])
-                        existing_unit.upgrade()
-                        self._build_stack.append((UPGRADE, x, y))
-                        spawned_units += 1
-            else:
-                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.".format(location))
+            costs, reason = self.__upgrade_check(location, self.get_resources())
+            if reason is not None:
+                self.warn("Could not upgrade a unit from {}. {}".format(location, reason))
+                continue
+            x, y = map(int, location)
+            self.__set_resource(SP, 0 - costs[SP])
+            self.__set_resource(MP, 0 - costs[MP])
+            self.__upgrade_at(x, y)
+            spawned_units += 1
         return spawned_units
 
+    def __upgrade_check(self, location, resources, planned_structures=(), planned_upgrades=()):
+        """Checks whether the structure at a location can be upgraded. Never warns, the reason is left to the caller.
+
+        Args:
+            location: The location of the structure
+            resources: The [SP, MP] left to pay for the upgrade
+            planned_structures: The location indices x * ARENA_SIZE + y of structures about to be spawned, mapped to their types
+            planned_upgrades: The location indices of structures about to be upgraded
+
+        Returns:
+            A (costs, reason) tuple, where costs is the [SP, MP] cost of the upgrade, and reason is None if it can be done
+
+        """
+        if not self.game_map.in_arena_bounds(location):
+            return None, "Location invalid."
+        x, y = map(int, location)
+        index = x * self.ARENA_SIZE + y
+        if index in planned_structures:
+            unit_type, upgraded = planned_structures[index], False
+        else:
+            existing_unit = self.contains_stationary_unit([x, y])
+            if not existing_unit:
+                unit_type = None
+            else:
+                unit_type, upgraded = existing_unit.unit_type, existing_unit.upgraded
+        if y >= self.HALF_ARENA or unit_type is None:
+            return None, "Location has no structures or is enemy territory."
+        if upgraded or index in planned_upgrades or self.config["unitInformation"][UNIT_TYPE_TO_INDEX[unit_type]].get("upgrade", None) is None:
+            return None, "Unit cannot be upgraded."
+        costs = self.type_cost(unit_type, True)
+        if resources[SP] < costs[SP] or resources[MP] < costs[MP]:
+            return costs, "Not enough resources."
+        return costs, None
+
+    def __upgrade_at(self, x, y):
+        """Upgrades our structure at [x, y] and adds it to the build stack, without checks or costs
+        """
+        for unit in self.game_map.edit_location([x, y]):
+            if unit.stationary:
+                unit.upgrade()
+        self.game_map.update_masks([x, y])
+        self._build_stack.append((UPGRADE, x, y))
+
+    def attempt_plan(self, plan, all_or_nothing=False):
+        """Attempts a whole set of spawns, upgrades and removals at once.
+
+        The plan is checked in a single pass, each item against the resources left by the items before it
+        and the locations they took, as if those were already applied. A structure spawned by the plan can be
+        upgraded or removed by a later item and blocks later spawns at its location. The number of mobile units
+        that fit in a location is computed from the resources at once. The items that passed are then applied
+        together to the map, the resources and the command stacks.
+
+        Args:
+            plan: A list of (action, locations) or (action, locations, num) items, where action is a unit type,
+                UPGRADE or REMOVE, locations is a single location or a list of locations, and num is the number of
+                units to spawn at each location, 1 if omitted
+            all_or_nothing: If True, nothing is applied unless every item of the plan can be done in full
+
+        Returns:
+            A list with one (done, failures) tuple per item, where done is the number of units spawned, upgraded
+            or flagged for removal, and failures is a list of (location, reason) tuples for the locations where
+            less than asked was done. When all_or_nothing stops the plan, done is 0 for every item.
+
+        """
+        resources = self.get_resources()
+        planned_structures = {}
+        planned_mobile = set()
+        planned_upgrades = set()
+        actions = []
+        results = []
+        for item in plan:
+            action, locations = item[0], item[1]
+            num = item[2] if len(item) > 2 else 1
+            if type(locations[0]) == int:
+                locations = [locations]
+            done = 0
+            failures = []
+            for location in locations:
+                if action == REMOVE:
+                    if not self.game_map.in_arena_bounds(location):
+                        failures.append((location, "Location invalid."))
+                        continue
+                    x, y = map(int, location)
+                    if y >= self.HALF_ARENA or not (self.contains_stationary_unit([x, y]) or x * self.ARENA_SIZE + y in planned_structures):
+                        failures.append((location, "Location has no structures or is enemy territory."))
+                        continue
+                    actions.append((REMOVE, x, y, 1))
+                    done += 1
+                elif action == UPGRADE:
+                    costs, reason = self.__upgrade_check(location, resources, planned_structures, planned_upgrades)
+                    if reason is not None:
+                        failures.append((location, reason))
+                        continue
+                    x, y = map(int, location)
+                    resources = [resources[SP] - costs[SP], resources[MP] - costs[MP]]
+                    planned_upgrades.add(x * self.ARENA_SIZE + y)
+                    actions.append((UPGRADE, x, y, 1))
+                    done += 1
+                elif action not in ALL_UNITS:
+                    failures.append((location, "Invalid unit."))
+                else:
+                    count, reasons = self.__spawn_check(action, location, num, resources, planned_structures, planned_mobile)
+                    if count > 0:
+                        x, y = map(int, location)
+                        costs = self.type_cost(action)
+                        resources = [resources[SP] - costs[SP] * count, resources[MP] - costs[MP] * count]
+                        if is_stationary(action):
+                            planned_structures[x * self.ARENA_SIZE + y] = action
+                        else:
+                            planned_mobile.add(x * self.ARENA_SIZE + y)
+                        actions.append((action, x, y, count))
+                        done += count
+                    if reasons:
+                        failures.append((location, " ".join(reasons)))
+            if action == REMOVE or action == UPGRADE:
+                verb = "remove a unit from" if action == REMOVE else "upgrade a unit from"
+            else:
+                verb = "spawn {} at location".format(action)
+            for location, reason in failures:
+                self.warn("Could not {} {}. {}".format(verb, location, reason))
+            results.append((done, failures))
+
+        if all_or_nothing and any(failures for _, failures in results):
+            return [(0, failures) for _, failures in results]
+        for action, x, y, count in actions:
+            if action == REMOVE:
+                self._build_stack.append((REMOVE, x, y))
+            elif action == UPGRADE:
+                self.__upgrade_at(x, y)
+            else:
+                self.__add_units(action, x, y, count)
+        self._player_resources[0]["SP"] = resources[SP]
+        self._player_resources[0]["MP"] = resources[MP]
+        return results
+
     def get_target_edge(self, start_location):
         """Gets the target edge given a starting location
 
@@ -491,9 +741,48 @@ class GameState:
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
-        end_points = self.game_map.get_edge_locations(target_edge)
+        end_points = EDGES[target_edge]
         return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
 
+    def find_paths_to_edge_batch(self, start_locations, target_edge=None):
+        """Gets the paths units at several locations would take.
+        Equivalent to calling find_path_to_edge for each location, but the pathing
+        work is shared between all locations that target the same edge.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Induced from each start location if None.
+
+        Returns:
+            A list with one entry per start location, in the same order. Each entry is the path
+            find_path_to_edge would return for that location, or None if the location is blocked.
+
+        """
+        paths = [None] * len(start_locations)
+        starts_by_edge = {}
+        for i, start_location in enumerate(start_locations):
+            if self.contains_stationary_unit(start_location):
+                self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+                continue
+            edge = self.get_target_edge(start_location) if target_edge is None else target_edge
+            starts_by_edge.setdefault(edge, []).append(i)
+
+        for edge, indices in starts_by_edge.items():
+            end_points = EDGES[edge]
+            edge_paths = self._shortest_path_finder.navigate_multiple_starts([start_locations[i] for i in indices], end_points, self)
+            for i, path in zip(indices, edge_paths):
+                paths[i] = path
+        return paths
+
+    def clear_pathing_cache(self):
+        """Forgets all memoized pathing results.
+        Paths are cached per structure layout, using the structure bitmasks of game_map.
+        The cache follows changes made through game_map.add_unit, game_map.remove_unit and
+        attempt_spawn. After editing the unit list of a location directly, call
+        game_map.update_masks(location) so the cache sees the new layout.
+        """
+        self._shortest_path_finder.clear_cache()
+
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
 
@@ -508,7 +797,9 @@ class GameState:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
         x, y = map(int, location)
-        for unit in self.game_map[x,y]:
+        if not (self.game_map.get_structure_mask() >> (x * self.ARENA_SIZE + y)) & 1:
+            return False
+        for unit in self.game_map._units_at(x, y):
             if unit.stationary:
                 return unit
         return False
@@ -538,6 +829,10 @@ class GameState:
         Their targeting priority is as follows:
             Infantry > Nearest Unit > Lowest Health > Lowest Y position > Closest to edge (Highest distance of X from the boards center, 13.5)
 
+        Only the locations in range that hold an enemy unit the attacker can damage are visited, see GameMap.get_occupied_mask.
+        Units appended to a list read with game_map[x, y] are seen, but replacing a unit in such a list
+        needs game_map.update_masks(location) first.
+
         Args:
             attacking_unit: A GameUnit
 
@@ -551,7 +846,17 @@ class GameState:
             return
 
         attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
+        candidates = None
+        if attacking_unit.player_index == 0 or attacking_unit.player_index == 1:
+            enemy_index = 1 - attacking_unit.player_index
+            candidates = 0
+            if attacking_unit.damage_f != 0:
+                candidates |= self.game_map.get_structure_mask(enemy_index)
+            if attacking_unit.damage_i != 0:
+                candidates |= self.game_map.get_mobile_mask(enemy_index)
+            if not candidates:
+                return None
+        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange, candidates)
         target = None
         target_stationary = True
         target_distance = sys.maxsize
@@ -560,7 +865,7 @@ class GameState:
         target_x_distance = 0
 
         for location in possible_locations:
-            for unit in self.game_map[location]:
+            for unit in self.game_map._units_at(location[0], location[1]):
                 if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
                     continue
 
@@ -610,8 +915,95 @@ class GameState:
                     target_x_distance = unit_x_distance
         return target
 
+    def get_targets(self, attacking_units=None):
+        """Gets the targets of many units at once, chosen exactly as get_target would.
+        The board is read once, keeping the preferred unit of each player at every occupied location,
+        sorted by row. Each attacker then only compares the preferred units in its range, found by bisecting
+        the rows it reaches. Structures are only looked at when no mobile unit is in range.
+        Like get_target, units replaced in a list read with game_map[x, y] need game_map.update_masks(location) first.
+
+        Args:
+            attacking_units: A list of GameUnits, every unit of both players that deals damage if None
+
+        Returns:
+            A list of (attacking_unit, target) pairs in the order of attacking_units, target being None when nothing is in range
+
+        """
+        game_map = self.game_map
+        #Per player, the preferred unit of the player at every location holding its units, by location index x * ARENA_SIZE + y.
+        #Units on the same location only differ by health, so the preferred one is the first with the lowest health
+        mobiles = ({}, {})
+        structures = ({}, {})
+        board_units = [] if attacking_units is None else None
+        for x, y in game_map.mask_to_locations(game_map.get_occupied_mask()):
+            index = x * self.ARENA_SIZE + y
+            for unit in game_map._units_at(x, y):
+                if board_units is not None and unit.damage_i + unit.damage_f > 0:
+                    board_units.append(unit)
+                if unit.player_index != 0 and unit.player_index != 1:
+                    continue
+                preferred = structures[unit.player_index] if unit.stationary else mobiles[unit.player_index]
+                best = preferred.get(index)
+                if best is None or unit.health < best.health:
+                    preferred[index] = unit
+        if attacking_units is None:
+            attacking_units = board_units
+        mobile_rows = tuple(_rows_by_y(preferred, self.ARENA_SIZE) for preferred in mobiles)
+        structure_rows = tuple(_rows_by_y(preferred, self.ARENA_SIZE) for preferred in structures)
+
+        hit_radius = self.config["unitInformation"][0]['getHitRadius']
+        center = self.HALF_ARENA - 0.5
+        targets = []
+        for attacker in attacking_units:
+            if not isinstance(attacker, GameUnit):
+                self.warn("Passed a {} to get_targets as an attacking unit. Expected a GameUnit.".format(type(attacker)))
+                targets.append((attacker, None))
+                continue
+            x, y = attacker.x, attacker.y
+            y_sign = 1 if attacker.player_index == 0 else -1
+            target = None
+            for rows, can_hit in ((mobile_rows, attacker.damage_i != 0), (structure_rows, attacker.damage_f != 0)):
+                if not can_hit:
+                    continue
+                best_key = None
+                for player_index in (0, 1):
+                    player_rows = rows[player_index]
+                    if player_index == attacker.player_index or not player_rows:
+                        continue
+                    for dy, width in range_rows(attacker.attackRange, hit_radius):
+                        row = player_rows.get(y + dy)
+                        if row is None:
+                            continue
+                        xs, units = row
+                        for i in range(bisect_left(xs, x - width), bisect_right(xs, x + width)):
+                            unit = units[i]
+                            key = (math.sqrt((xs[i] - x) ** 2 + dy ** 2), unit.health, y_sign * unit.y, -abs(center - unit.x))
+                            if best_key is None or key < best_key:
+                                best_key = key
+                                target = unit
+                if target is not None:
+                    break
+            targets.append((attacker, target))
+        return targets
+
+    def get_threat_map(self):
+        """Gets the threat map of the current board, building it on first use.
+        The threat map follows later changes made through attempt_spawn, attempt_upgrade
+        and the add_unit / remove_unit functions of game_map.
+
+        Returns:
+            A ThreatMap with the per frame damage enemy structures deal at every location, for both players
+
+        """
+        if self.game_map._threat_map is None:
+            self.game_map._threat_map = ThreatMap(self.game_map)
+        else:
+            self.game_map._sync_masks()
+        return self.game_map._threat_map
+
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
+        The structures are found with the masks of game_map, see get_target for units edited in place.
 
         Args:
             location: The location of a hypothetical defender
@@ -635,9 +1027,89 @@ class GameState:
         for unit in self.config["unitInformation"]:
             if unit.get('attackRange', 0) >= max_range:
                 max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
+        candidates = None
+        if player_index == 0 or player_index == 1:
+            candidates = self.game_map.get_occupied_mask(1 - player_index)
+        possible_locations= self.game_map.get_locations_in_range(location, max_range, candidates)
         for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
+            for unit in self.game_map._units_at(location_unit[0], location_unit[1]):
                 if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
                     attackers.append(unit)
         return attackers
+
+
+
+def _rows_by_y(units_by_index, arena_size):
+    """Groups units given by location index x * arena_size + y, in increasing index order, into rows
+
+    Returns:
+        A dict mapping each y to a (x values, units) pair of lists, in increasing x order
+
+    """
+    rows = {}
+    for index, unit in units_by_index.items():
+        x, y = divmod(index, arena_size)
+        row = rows.get(y)
+        if row is None:
+            rows[y] = ([x], [unit])
+        else:
+            row[0].append(x)
+            row[1].append(unit)
+    return rows
+
+
+"""
+Attributes LazyGameState builds on first access
+"""
+_LAZY_ATTRIBUTES = frozenset(["game_map", "unit_store", "_shortest_path_finder", "_build_stack", "_deploy_stack",
+                              "_checkpoints", "_player_resources", "my_health", "my_time", "enemy_health", "enemy_time"])
+
+
+class LazyGameState(GameState):
+    """A GameState that only builds its map, resources and unit lists the first time one of them is used.
+
+    Action phases send hundreds of frames per turn and most of them are only read for their events,
+    so a LazyGameState only decodes the frame (if given a string) and reads its turn number. Reading
+    game_map, calling get_resource or any other function that needs the board parses the frame
+    exactly like GameState does. The units are read into a UnitStore by default, see GameState.
+
+    Attributes :
+        * serialized_string (string or dict): The game state this object was built from, see GameState
+        * state (dict): The decoded game state
+        * events (dict): The events of the frame, such as "breach", "death" and "damage"
+
+    """
+    def __init__(self, config, serialized_string, lazy_units=True):
+        """ Reads the turn number and keeps the decoded state for later
+
+        Args:
+            * config (JSON): A json object containing information about the game
+            * serialized_string (string): A string containing information about the game state, or the dict it decodes to
+            * lazy_units (bool): Whether the units are read into a UnitStore once the board is built
+
+        """
+        self.serialized_string = serialized_string
+        self.config = config
+        self.enable_warnings = True
+        self._lazy_units = lazy_units
+        self._set_unit_constants(config)
+        self.state = decode(serialized_string) if isinstance(serialized_string, str) else serialized_string
+        self.events = self.state.get("events", {})
+        self.turn_number = int(self.state["turnInfo"][1])
+
+    def suppress_warnings(self, suppress):
+        """Suppress all warnings, without building the board
+
+        Args:
+            suppress: If true, disable warnings. If false, enable warnings.
+
+        """
+        self.enable_warnings = not suppress
+        if "game_map" in self.__dict__:
+            self.game_map.enable_warnings = not suppress
+
+    def __getattr__(self, name):
+        if name in _LAZY_ATTRIBUTES and "game_map" not in self.__dict__:
+            self._build_state(self.state)
+            return getattr(self, name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
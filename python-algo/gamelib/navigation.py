@@ -1,24 +1,63 @@
 import heapq
-import math
 import sys
-import queue
+from array import array
+from collections import deque, OrderedDict
 from .util import debug_write
 
-class Node:
-    """A pathfinding node
+ARENA_SIZE = 28
+HALF_ARENA = ARENA_SIZE // 2
+BOARD_CELLS = ARENA_SIZE * ARENA_SIZE
+
+
+def _in_arena(x, y):
+    if y < HALF_ARENA:
+        return HALF_ARENA - 1 - y <= x <= HALF_ARENA + y
+    return y - HALF_ARENA <= x <= ARENA_SIZE + HALF_ARENA - 1 - y
+
+
+def _build_neighbors():
+    # Same ordering as ShortestPathFinder._get_neighbors: up, down, right, left
+    neighbors = []
+    for x in range(ARENA_SIZE):
+        for y in range(ARENA_SIZE):
+            candidates = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+            neighbors.append(tuple(nx * ARENA_SIZE + ny for nx, ny in candidates
+                                   if 0 <= nx < ARENA_SIZE and 0 <= ny < ARENA_SIZE and _in_arena(nx, ny)))
+    return tuple(neighbors)
+
+
+"""
+Board sized lookup tables shared by every path finder.
+A location [x, y] is stored at index x * ARENA_SIZE + y.
+"""
+ARENA_TILES = tuple((x, y, x * ARENA_SIZE + y) for x in range(ARENA_SIZE) for y in range(ARENA_SIZE) if _in_arena(x, y))
+NEIGHBORS = _build_neighbors()
+_CLEARED = bytes(BOARD_CELLS)
+_NO_PATHLENGTH = array('i', [-1]) * BOARD_CELLS
+
+"""
+End points prepared by _set_end_points, by id of the end point tuple, such as the edges of GameMap.
+Entries keep their tuple so a reused id is never mistaken for it.
+"""
+_PREPARED_END_POINTS = {}
+MAX_PREPARED_END_POINTS = 64
+
+MAX_CACHED_FIELDS = 256
+
+
+class PathField:
+    """The validated pathlength field for one structure layout and set of endpoints
 
     Attributes :
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
-        * pathlength: The distance between this node and the target location
+        * pathlength (array): The distance between each tile and the target location, -1 if unreached
+        * paths (dict): Paths already extracted from this field, keyed by start location (x, y)
+        * pocket_tiles (list): Tiles validated from a self destruct location rather than from the endpoints
 
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    def __init__(self, pathlength):
+        self.pathlength = pathlength
+        self.paths = {}
+        self.pocket_tiles = []
 
 """
 This class helps with pathfinding. We guarantee the results will
@@ -28,29 +67,60 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles pathfinding
 
+    The search state lives in flat buffers indexed by x * ARENA_SIZE + y.
+    Pathing only depends on which tiles hold structures, so the validated
+    pathlength fields and the paths extracted from them are memoized per
+    (blocked tiles, endpoints) pair, with the structure bitmask of the GameMap
+    as the layout key. When the new layout differs from the
+    previous one by a single tile, the previous field is repaired around that
+    tile instead of being recomputed from scratch.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
 
         * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
+        * blocked (bytearray): 1 if there is a structure at this tile
+        * visited_idealness (bytearray): 1 if we visited this tile during the idealness search step
+        * pathlength (array): The field currently in use, the distance between each tile and the target location, -1 if unreached
 
     """
     def __init__(self):
         self.HORIZONTAL = 1
         self.VERTICAL = 2
         self.initialized = False
+        self.blocked = bytearray(BOARD_CELLS)
+        self.visited_idealness = bytearray(BOARD_CELLS)
+        self.end_point_mask = bytearray(BOARD_CELLS)
+        self.pathlength = array('i', _NO_PATHLENGTH)
+        self._fields = OrderedDict()
+        self._last_fields = {}
+        self._anchor_fields = {}
+        self._layout_key = None
 
     def initialize_map(self, game_state):
-        """Initializes the map
+        """Initializes the map, reading the blocked tiles if the layout changed since the last search
 
         Args:
             game_state: A GameState object representing the gamestate we want to traverse
         """
-        #Initialize map 
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self._load_layout(game_state.game_map.get_structure_mask())
+
+    def _load_layout(self, layout_key):
+        if not layout_key == self._layout_key:
+            self.blocked[:] = _CLEARED
+            self._layout_key = layout_key
+            self._fill_walls()
+
+    def clear_cache(self):
+        """Forgets every memoized pathlength field and path
+        """
+        self._fields.clear()
+        self._last_fields.clear()
+        self._anchor_fields.clear()
+        self._layout_key = None
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
         """Finds the path a unit would take to reach a set of endpoints
@@ -68,44 +138,299 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
+        return self.navigate_multiple_starts([start_point], end_points, game_state)[0]
+
+    def navigate_multiple_starts(self, start_points, end_points, game_state):
+        """Finds the paths units at several start points would take to reach the same set of endpoints
+
+        The pathlength field seeded from the endpoints does not depend on the start point,
+        so it is computed once and shared by every start that can reach the edge. Starts in
+        pockets without edge access are validated once per pocket.
+
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
+
+        Returns:
+            A list with the path for each start point, in the same order as start_points.
+            The entry is None if the start point is blocked. Each path matches what
+            navigate_multiple_endpoints would return for that start point.
+
+        """
         self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
-        #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
+        return self._navigate(start_points, end_points)
+
+    def navigate_with_layout(self, start_points, end_points, structure_mask):
+        """Finds the paths units at several start points would take on a hypothetical layout
+
+        Works like navigate_multiple_starts, but the blocked tiles are given as a structure
+        bitmask (bit x * 28 + y set for every structure, see GameMap.get_structure_mask)
+        instead of being read from a game state. Used to path on boards that only exist
+        inside a simulation.
+
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * structure_mask: An int with one bit set per tile holding a structure
+
+        Returns:
+            A list with the path for each start point, in the same order as start_points.
+            The entry is None if the start point is blocked.
+
+        """
+        self._load_layout(structure_mask)
+        return self._navigate(start_points, end_points)
+
+    def _navigate(self, start_points, end_points):
+        field = self._get_field(end_points)
+        blocked = self.blocked
+        pathlength = self.pathlength
+
+        paths = []
+        for start_point in start_points:
+            x, y = start_point
+            path = field.paths.get((x, y))
+            if path is None:
+                start_index = x * ARENA_SIZE + y
+                if blocked[start_index]:
+                    paths.append(None)
+                    continue
+                if pathlength[start_index] == -1:
+                    #The pocket cannot reach the edge, validate it from its self destruct location
+                    ideal_tile = self._idealness_search(start_point, end_points)
+                    field.pocket_tiles.extend(self._validate(ideal_tile, end_points))
+                path = self._get_path(start_point, end_points)
+                field.paths[(x, y)] = path
+            #Hand out copies so callers can not corrupt the memoized path
+            paths.append([start_point] + [[step[0], step[1]] for step in path[1:]])
+        return paths
+
+    def _get_field(self, end_points):
+        """Makes the memoized field for the current layout and end_points the active one.
+        A field that is not cached yet is repaired from the last field used with the same
+        end_points if only one tile changed, and validated from the endpoints otherwise.
+        """
+        end_points_key = self._set_end_points(end_points)
+        key = (self._layout_key, end_points_key)
+        field = self._fields.get(key)
+        if field is not None:
+            self._fields.move_to_end(key)
+            self._last_fields[end_points_key] = (self._layout_key, field)
+            self.pathlength = field.pathlength
+            return field
+
+        #Try repairing the last field used, then the last fully validated one. The second
+        #covers searches that undo each trial edit before making the next one.
+        toggled = None
+        for layout_key, base_field in (self._last_fields.get(end_points_key, (None, None)),
+                                       self._anchor_fields.get(end_points_key, (None, None))):
+            if base_field is None:
+                continue
+            difference = layout_key ^ self._layout_key
+            if difference & (difference - 1) == 0:
+                toggled = difference.bit_length() - 1
+                break
+
+        if len(self._fields) >= MAX_CACHED_FIELDS:
+            #Recycle the buffer of the least recently used field
+            _, evicted = self._fields.popitem(last=False)
+            pathlength = evicted.pathlength
+            if toggled is not None:
+                pathlength[:] = base_field.pathlength
+            self._forget_field(evicted)
+        else:
+            pathlength = array('i', _NO_PATHLENGTH)
+            if toggled is not None:
+                pathlength[:] = base_field.pathlength
+        field = PathField(pathlength)
+        self._fields[key] = field
+        self._last_fields[end_points_key] = (self._layout_key, field)
+        self.pathlength = pathlength
+
+        if toggled is None:
+            pathlength[:] = _NO_PATHLENGTH
+            #Every pocket that touches an open endpoint shares this part of the field
+            self._validate(end_points[0], end_points)
+            self._anchor_fields[end_points_key] = (self._layout_key, field)
+        else:
+            #The pockets are validated lazily again, only the part seeded from the endpoints is repaired
+            for location in base_field.pocket_tiles:
+                pathlength[location] = -1
+            if self.blocked[toggled]:
+                self._repair_blocked(toggled)
+            else:
+                self._repair_opened(toggled)
+        return field
+
+    def _forget_field(self, field):
+        """Drops the repair references to a field whose buffer is being recycled
+        """
+        for references in (self._last_fields, self._anchor_fields):
+            for end_points_key, (_, referenced_field) in list(references.items()):
+                if referenced_field is field:
+                    del references[end_points_key]
+
+    def _repair_blocked(self, location):
+        """Updates the field seeded from the endpoints after a structure was added at location.
+        Only tiles whose every shortest route went through location are recomputed.
+        """
+        blocked = self.blocked
+        pathlength = self.pathlength
+        removed_pathlength = pathlength[location]
+        if not self.end_point_mask[location]:
+            pathlength[location] = -1
+        if removed_pathlength == -1:
+            return
+
+        #Find the tiles that lost all their parents, in order of increasing pathlength
+        affected = set()
+        judged = {location}
+        candidates = deque(neighbor for neighbor in NEIGHBORS[location]
+                           if not blocked[neighbor] and pathlength[neighbor] == removed_pathlength + 1)
+        while candidates:
+            tile = candidates.popleft()
+            if tile in judged:
+                continue
+            judged.add(tile)
+            tile_pathlength = pathlength[tile]
+            has_parent = False
+            for neighbor in NEIGHBORS[tile]:
+                if (not blocked[neighbor] and pathlength[neighbor] == tile_pathlength - 1
+                        and neighbor not in affected):
+                    has_parent = True
+                    break
+            if has_parent:
+                continue
+            affected.add(tile)
+            for neighbor in NEIGHBORS[tile]:
+                if not blocked[neighbor] and pathlength[neighbor] == tile_pathlength + 1:
+                    candidates.append(neighbor)
+
+        #Reconnect the affected tiles through the tiles that kept their pathlength
+        heap = []
+        for tile in affected:
+            best = -1
+            for neighbor in NEIGHBORS[tile]:
+                if blocked[neighbor] or neighbor in affected:
+                    continue
+                neighbor_pathlength = pathlength[neighbor]
+                if not neighbor_pathlength == -1 and (best == -1 or neighbor_pathlength + 1 < best):
+                    best = neighbor_pathlength + 1
+            if not best == -1:
+                heap.append((best, tile))
+        for tile in affected:
+            pathlength[tile] = -1
+        heapq.heapify(heap)
+        while heap:
+            tile_pathlength, tile = heapq.heappop(heap)
+            if not pathlength[tile] == -1:
+                continue
+            pathlength[tile] = tile_pathlength
+            for neighbor in NEIGHBORS[tile]:
+                if neighbor in affected and pathlength[neighbor] == -1:
+                    heapq.heappush(heap, (tile_pathlength + 1, neighbor))
+
+    def _repair_opened(self, location):
+        """Updates the field seeded from the endpoints after the structure at location was removed.
+        Pathlengths can only shrink, so the improvement is spread outwards from location.
+        """
+        blocked = self.blocked
+        pathlength = self.pathlength
+        if not self.end_point_mask[location]:
+            best = -1
+            for neighbor in NEIGHBORS[location]:
+                neighbor_pathlength = pathlength[neighbor]
+                if not blocked[neighbor] and not neighbor_pathlength == -1 and (best == -1 or neighbor_pathlength + 1 < best):
+                    best = neighbor_pathlength + 1
+            pathlength[location] = best
+            if best == -1:
+                return
+
+        current = deque([location])
+        while current:
+            tile = current.popleft()
+            next_pathlength = pathlength[tile] + 1
+            for neighbor in NEIGHBORS[tile]:
+                if blocked[neighbor]:
+                    continue
+                neighbor_pathlength = pathlength[neighbor]
+                if neighbor_pathlength == -1 or neighbor_pathlength > next_pathlength:
+                    pathlength[neighbor] = next_pathlength
+                    current.append(neighbor)
+
+    def _fill_walls(self):
+        """Marks every tile holding a structure as blocked, using the structure bitmask of the map
+        """
+        blocked = self.blocked
+        mask = self._layout_key
+        while mask:
+            lowest = mask & -mask
+            blocked[lowest.bit_length() - 1] = 1
+            mask ^= lowest
+
+    def _set_end_points(self, end_points):
+        """Marks the end points so membership tests are a single lookup.
+        The marks of end point tuples, such as the edges of GameMap, are only computed once.
+
+        Returns:
+            The end points as a tuple of (x, y) tuples
+
+        """
+        cacheable = type(end_points) is tuple
+        prepared = _PREPARED_END_POINTS.get(id(end_points)) if cacheable else None
+        if prepared is None or prepared[0] is not end_points:
+            key = tuple((x, y) for x, y in end_points)
+            marks = bytearray(BOARD_CELLS)
+            for x, y in key:
+                marks[x * ARENA_SIZE + y] = 1
+            prepared = (end_points, key, bytes(marks), self._get_direction_from_endpoints(end_points))
+            if cacheable and len(_PREPARED_END_POINTS) < MAX_PREPARED_END_POINTS:
+                _PREPARED_END_POINTS[id(end_points)] = prepared
+        self.end_point_mask[:] = prepared[2]
+        self.direction = prepared[3]
+        return prepared[1]
 
     def _idealness_search(self, start, end_points):
         """
         Finds the most ideal tile in our 'pocket' of pathable space. 
         The edge if it is available, or the best self destruct location otherwise
         """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
+        blocked = self.blocked
+        visited = self.visited_idealness
+        visited[:] = _CLEARED
+        end_point_mask = self.end_point_mask
+        right = self.direction[0] == 1
+        up = self.direction[1] == 1
+
+        start_index = start[0] * ARENA_SIZE + start[1]
+        current = deque([start_index])
+        if end_point_mask[start_index]:
+            best_idealness = sys.maxsize
+        else:
+            best_idealness = ARENA_SIZE * (start[1] if up else ARENA_SIZE - 1 - start[1]) + (start[0] if right else ARENA_SIZE - 1 - start[0])
+        visited[start_index] = 1
         most_ideal = start
 
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        while current:
+            search_location = current.popleft()
+            for neighbor in NEIGHBORS[search_location]:
+                if blocked[neighbor]:
                     continue
 
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
+                if end_point_mask[neighbor]:
+                    current_idealness = sys.maxsize
+                else:
+                    x, y = divmod(neighbor, ARENA_SIZE)
+                    current_idealness = ARENA_SIZE * (y if up else ARENA_SIZE - 1 - y) + (x if right else ARENA_SIZE - 1 - x)
 
                 if current_idealness > best_idealness:
                     best_idealness = current_idealness
-                    most_ideal = neighbor
+                    most_ideal = list(divmod(neighbor, ARENA_SIZE))
 
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
+                if not visited[neighbor]:
+                    visited[neighbor] = 1
+                    current.append(neighbor)
 
         return most_ideal
 
@@ -128,9 +453,9 @@ class ShortestPathFinder:
         point = end_points[0]
         x, y = point
         direction = [1, 1]
-        if x < self.game_state.HALF_ARENA:
+        if x < HALF_ARENA:
            direction[0] = -1
-        if y < self.game_state.HALF_ARENA:
+        if y < HALF_ARENA:
             direction[1] = -1
         return direction
 
@@ -161,95 +486,95 @@ class ShortestPathFinder:
     def _validate(self, ideal_tile, end_points):
         """Breadth first search of the grid, setting the pathlengths of each node
 
+        Returns:
+            The tiles that were given a pathlength
+
         """
-        #VALDIATION
+        #Open tiles are visited once they have a pathlength, pockets never overlap so
+        #one field can hold the edge pockets and any number of self destruct pockets
+        blocked = self.blocked
+        pathlength = self.pathlength
+
         #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
+        current = deque()
+        reached = []
+        if self.end_point_mask[ideal_tile[0] * ARENA_SIZE + ideal_tile[1]]:
+            for x, y in end_points:
+                location = x * ARENA_SIZE + y
+                current.append(location)
+                #Set current pathlength to 0
+                pathlength[location] = 0
         else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
+            location = ideal_tile[0] * ARENA_SIZE + ideal_tile[1]
+            current.append(location)
+            pathlength[location] = 0
 
         #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        while current:
+            current_location = current.popleft()
+            reached.append(current_location)
+            if blocked[current_location]:
+                continue
+            next_pathlength = pathlength[current_location] + 1
+            for neighbor in NEIGHBORS[current_location]:
+                if blocked[neighbor] or not pathlength[neighbor] == -1:
                     continue
-
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
+                pathlength[neighbor] = next_pathlength
+                current.append(neighbor)
 
         #debug_write("Print after validate")
         #self.print_map()
-        return
+        return reached
 
     def _get_path(self, start_point, end_points):
         """Once all nodes are validated, and a target is found, the unit can path to its target
 
         """
         #GET THE PATH
+        pathlength = self.pathlength
         path = [start_point]
-        current = start_point
+        current = start_point[0] * ARENA_SIZE + start_point[1]
         move_direction = 0
 
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
+        while not pathlength[current] == 0:
             next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
 
-            if current[0] == next_move[0]:
+            if current // ARENA_SIZE == next_move // ARENA_SIZE:
                 move_direction = self.VERTICAL
             else:
                 move_direction = self.HORIZONTAL
-            path.append(next_move)
+            path.append(list(divmod(next_move, ARENA_SIZE)))
             current = next_move
         
         #debug_write(path)
         return path
   
     def _choose_next_move(self, current_point, previous_move_direction, end_points):
-        """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
+        """Given the current tile index and adjacent tiles, return the index of the best 'next step' for a given unit to take
         """
-        neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
+        blocked = self.blocked
+        pathlength = self.pathlength
 
         ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
-        for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        best_pathlength = pathlength[current_point]
+        for neighbor in NEIGHBORS[current_point]:
+            if blocked[neighbor]:
                 continue
 
-            new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
+            current_pathlength = pathlength[neighbor]
 
             #Filter by pathlength
             if current_pathlength > best_pathlength:
                 continue
-            elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
-                new_best = True
-
             #Filter by direction based on prev move
-            if not new_best and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, end_points):
+            if current_pathlength == best_pathlength and not self._better_direction(
+                    divmod(current_point, ARENA_SIZE), divmod(neighbor, ARENA_SIZE),
+                    divmod(ideal_neighbor, ARENA_SIZE), previous_move_direction, end_points):
                 continue
 
             ideal_neighbor = neighbor
             best_pathlength = current_pathlength
 
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
         return ideal_neighbor
 
     def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
@@ -299,9 +624,9 @@ class ShortestPathFinder:
 
         for y in range(28):
             for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+                index = x * ARENA_SIZE + 28 - y - 1
+                if not self.blocked[index] and not self.pathlength[index] == -1:
+                    self._print_justified(self.pathlength[index])
                 else:
                     sys.stderr.write("   ")
             debug_write("")
@@ -0,0 +1,220 @@
+import time
+
+from .game_map import GameMap
+from .game_state import GameState
+from .navigation import ShortestPathFinder
+from .simulator import Simulator
+from .util import debug_write
+
+"""
+The functions a Profiler times when enable is called without targets
+"""
+DEFAULT_TARGETS = ("GameState.__init__", "GameState.find_path_to_edge", "GameState.get_attackers",
+                   "GameState.get_target", "GameState.attempt_spawn", "GameState.can_spawn")
+
+_CLASSES = {"GameState": GameState, "GameMap": GameMap, "ShortestPathFinder": ShortestPathFinder, "Simulator": Simulator}
+
+"""
+The Profiler whose timers are installed, only one can be enabled at a time
+"""
+_enabled = [None]
+
+
+class _Section:
+    """Context manager timing a block of code, see Profiler.section
+    """
+    __slots__ = ("durations", "start")
+
+    def __init__(self, durations):
+        self.durations = durations
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.durations.append(time.perf_counter() - self.start)
+        return False
+
+
+class _NoSection:
+    """Context manager that does nothing, returned by Profiler.section while the profiler is disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SECTION = _NoSection()
+
+
+class Profiler:
+    """Counts and times calls to the hot functions of gamelib and reports them once per turn.
+
+    While disabled, nothing is installed, so the profiled functions run at their normal speed.
+    enable replaces the target functions on their classes with timed versions, and disable puts
+    the original functions back. Times are inclusive, so attempt_spawn includes its calls to can_spawn.
+
+    AlgoCore.enable_profiling creates one and calls end_turn after every turn. It can also be used on its
+    own, calling end_turn whenever a summary is wanted.
+
+    Attributes :
+        * output (string): The file summaries are added to, None to write them with debug_write
+        * enabled (bool): Whether or not the timers are installed
+        * durations (dict): The durations in seconds of each timed call since the last summary, by name
+        * counters (dict): The values counted with count since the last summary, by name
+
+    """
+    def __init__(self, output=None):
+        """Creates a disabled profiler
+
+        Args:
+            output: The path of a file to add the summaries to, None to write them to stderr
+
+        """
+        self.output = output
+        self.enabled = False
+        self.durations = {}
+        self.counters = {}
+        self._originals = []
+
+    def enable(self, targets=None):
+        """Installs the timers
+
+        Args:
+            targets: A list of functions to time, either "Class.function" strings naming a class of gamelib,
+                such as "GameMap.get_locations_in_range", or (class, function_name) pairs. DEFAULT_TARGETS if None
+
+        """
+        if self.enabled:
+            return
+        if _enabled[0] is not None:
+            debug_write("Another Profiler is enabled, disable it first")
+            return
+        for target in DEFAULT_TARGETS if targets is None else targets:
+            if isinstance(target, str):
+                class_name, _, attribute = target.partition(".")
+                owner = _CLASSES.get(class_name)
+            else:
+                owner, attribute = target
+            original = None if owner is None else owner.__dict__.get(attribute)
+            if original is None or not callable(original):
+                debug_write("Cannot profile {}, it is not a function of a gamelib class".format(target))
+                continue
+            self._originals.append((owner, attribute, original))
+            setattr(owner, attribute, self.__timed("{}.{}".format(owner.__name__, attribute), original))
+        self.enabled = True
+        _enabled[0] = self
+
+    def disable(self):
+        """Removes the timers, the recorded durations are kept until the next summary
+        """
+        if not self.enabled:
+            return
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals = []
+        self.enabled = False
+        _enabled[0] = None
+
+    def __durations(self, name):
+        durations = self.durations.get(name)
+        if durations is None:
+            durations = self.durations[name] = []
+        return durations
+
+    def __timed(self, name, function):
+        durations = self.__durations(name)
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                durations.append(perf_counter() - start)
+        timed.__name__ = function.__name__
+        timed.__doc__ = function.__doc__
+        timed.__wrapped__ = function
+        return timed
+
+    def section(self, name):
+        """Times a block of code, for use in a with statement. Does nothing while the profiler is disabled.
+
+        Args:
+            name: The name the block is reported under
+
+        Returns:
+            A context manager
+
+        """
+        if not self.enabled:
+            return _NO_SECTION
+        return _Section(self.__durations(name))
+
+    def count(self, name, amount=1):
+        """Adds to a counter reported in the next summary. Does nothing while the profiler is disabled.
+
+        Args:
+            name: The name of the counter
+            amount: The amount to add
+
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self, title="Profile"):
+        """Describes the calls recorded since the last summary
+
+        Args:
+            title: The first line of the summary
+
+        Returns:
+            A string with one line per timed function, the slowest first, then one line with the counters
+
+        """
+        lines = [title]
+        timed = [(sum(durations), name, sorted(durations)) for name, durations in self.durations.items() if durations]
+        for total, name, durations in sorted(timed, reverse=True):
+            lines.append("  {}: {} calls, {:.2f} ms total, p50 {:.3f} ms, p90 {:.3f} ms, max {:.3f} ms".format(
+                name, len(durations), total * 1000, _percentile(durations, 0.5) * 1000,
+                _percentile(durations, 0.9) * 1000, durations[-1] * 1000))
+        if self.counters:
+            lines.append("  counters: " + ", ".join("{}={}".format(name, value) for name, value in sorted(self.counters.items())))
+        return "\n".join(lines)
+
+    def reset(self):
+        """Forgets the calls and counters recorded so far
+        """
+        for durations in self.durations.values():
+            del durations[:]
+        self.counters.clear()
+
+    def end_turn(self, turn_number=None, turn_time=None):
+        """Writes the summary of the turn to the output, then resets
+
+        Args:
+            turn_number: The turn the summary is for
+            turn_time: The number of seconds the turn took
+
+        """
+        title = "Profile" if turn_number is None else "Turn {} profile".format(turn_number)
+        if turn_time is not None:
+            title += ", {:.1f} ms".format(turn_time * 1000)
+        text = self.summary(title)
+        if self.output is None:
+            debug_write(text)
+        else:
+            with open(self.output, "a") as output:
+                output.write(text + "\n")
+        self.reset()
+
+
+def _percentile(ordered, fraction):
+    """Nearest rank percentile of a sorted list
+    """
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
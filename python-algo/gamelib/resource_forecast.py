@@ -0,0 +1,164 @@
+"""
+The number of turns a ResourceForecast looks ahead when no horizon is given
+"""
+DEFAULT_HORIZON = 10
+
+
+def structure_income(config):
+    """Reads the resources each structure type generates per round
+
+    Args:
+        config: The game config
+
+    Returns:
+        A dict mapping each generating structure type to a (base, upgraded) pair of [SP, MP] incomes.
+        The upgrade values replace the base ones they name, like the other upgraded stats.
+
+    """
+    incomes = {}
+    for type_config in config["unitInformation"]:
+        if type_config.get("unitCategory") != 0:
+            continue
+        upgrade_config = type_config.get("upgrade", {})
+        base = [type_config.get("generatesResource1", 0), type_config.get("generatesResource2", 0)]
+        upgraded = [upgrade_config.get("generatesResource1", base[0]), upgrade_config.get("generatesResource2", base[1])]
+        if any(base) or any(upgraded):
+            incomes[type_config["shorthand"]] = (base, upgraded)
+    return incomes
+
+
+def bit_cap(config):
+    """Gets the most MP a player can hold
+
+    The cap is maxBits on every turn. turnIntervalForBitCapSchedule and bitRampBitCapGrowthRate are
+    deprecated in the config docs, previously used for a slowly ramping maximum MP, so they are ignored.
+
+    Args:
+        config: The game config
+
+    Returns:
+        The MP cap, infinite if the config has no maxBits
+
+    """
+    return config["resources"].get("maxBits", float("inf"))
+
+
+class ResourceForecast:
+    """Projects the SP and MP of both players over the next turns.
+
+    Everything that does not depend on how a player spends is worked out once when the forecast
+    is made: the round income of each future turn, with the MP ramp schedule of the config and the
+    income of the structures on the board, and the MP decay and cap. project then only has to walk
+    the horizon once per spend plan, so many plans can be compared in the same turn.
+
+    The engine rounds MP to one decimal every round and caps it, so projections are computed turn by turn
+    rather than with a closed formula, which would drift from the engine. The cap is the one of bit_cap.
+    Structures flagged for removal are not counted as income.
+
+    Attributes :
+        * turn_number (int): The turn the forecast starts from
+        * horizon (int): The number of turns projected after turn_number
+        * resources (list): The [SP, MP] of each player at the start of turn_number
+        * income (list): For each player, the [SP, MP] gained at the start of each of the next horizon turns
+        * decay (float): The fraction of MP lost every round, before the income is added
+        * max_bits (list): The most MP a player can hold at the start of each of the next horizon turns
+
+    """
+    def __init__(self, game_state, horizon=DEFAULT_HORIZON):
+        """Reads the resources, the config and the generating structures of a game state
+
+        Args:
+            game_state: The GameState of the current turn, including the structures you spawned so far
+            horizon: The number of turns to project
+
+        """
+        resources_config = game_state.config["resources"]
+        SP, MP = game_state.SP, game_state.MP
+        self.turn_number = game_state.turn_number
+        self.horizon = horizon
+        self.resources = [[game_state.get_resource(SP, i), game_state.get_resource(MP, i)] for i in (0, 1)]
+        self.decay = resources_config["bitDecayPerRound"]
+        self.max_bits = [bit_cap(game_state.config)] * horizon
+
+        ramp_interval = resources_config["turnIntervalForBitSchedule"]
+        ramp = resources_config["bitGrowthRate"]
+        round_income = [[resources_config["coresPerRound"], resources_config["bitsPerRound"] + ramp * ((self.turn_number + turn) // ramp_interval)]
+                        for turn in range(1, horizon + 1)]
+        self.income = []
+        for player_index in (0, 1):
+            structures = self.__structure_income(game_state, player_index)
+            self.income.append([[sp + structures[SP], mp + structures[MP]] for sp, mp in round_income])
+
+    @staticmethod
+    def __structure_income(game_state, player_index):
+        game_map = game_state.game_map
+        income = [0, 0]
+        for unit_type, incomes in structure_income(game_state.config).items():
+            for x, y in game_map.mask_to_locations(game_map.get_type_mask(unit_type, player_index)):
+                for unit in game_map._units_at(x, y):
+                    if unit.stationary and not unit.pending_removal:
+                        unit_income = incomes[1] if unit.upgraded else incomes[0]
+                        income[0] += unit_income[0]
+                        income[1] += unit_income[1]
+        return income
+
+    def project(self, player_index=0, spends=None, resources=None):
+        """Projects the resources of a player for a spend plan
+
+        Args:
+            player_index: The player to project, 0 for you 1 for the enemy
+            spends: A list of [SP, MP] amounts spent on each turn, starting with the current turn.
+                Turns past the end of the list spend nothing. Nothing is spent if None
+            resources: The [SP, MP] to start from instead of the current resources of the player
+
+        Returns:
+            A list of horizon + 1 [SP, MP] pairs, the resources at the start of each turn from the current one,
+            before that turn's spending. The plan is affordable if each turn's spend is at most its resources.
+
+        """
+        sp, mp = self.resources[player_index] if resources is None else resources
+        keep = 1 - self.decay
+        spends = spends or ()
+        planned = len(spends)
+        projected = [[sp, mp]]
+        for turn, (sp_income, mp_income) in enumerate(self.income[player_index]):
+            if turn < planned:
+                sp -= spends[turn][0]
+                mp -= spends[turn][1]
+            sp += sp_income
+            mp = min(round(mp * keep + mp_income, 1), self.max_bits[turn])
+            projected.append([sp, mp])
+        return projected
+
+    def affordable(self, player_index=0, spends=None, resources=None):
+        """Checks that a player can pay for every turn of a spend plan
+
+        Args:
+            player_index, spends, resources: See project
+
+        Returns:
+            True if no turn of the plan spends more than the player holds, False otherwise
+
+        """
+        projected = self.project(player_index, spends, resources)
+        return all(spend[0] <= held[0] and spend[1] <= held[1] for spend, held in zip(spends or (), projected))
+
+    def turns_until(self, costs, player_index=0, spends=None, resources=None):
+        """Finds how many turns a player has to wait to hold enough resources
+
+        Args:
+            costs: The [SP, MP] the player wants to hold
+            player_index, spends, resources: See project, the spends of a turn are paid before its resources are compared to costs
+
+        Returns:
+            The number of turns from the current one, 0 if the player already holds enough, None if not within the horizon
+
+        """
+        spends = spends or ()
+        for turn, (sp, mp) in enumerate(self.project(player_index, spends, resources)):
+            if turn < len(spends):
+                sp -= spends[turn][0]
+                mp -= spends[turn][1]
+            if sp >= costs[0] and mp >= costs[1]:
+                return turn
+        return None
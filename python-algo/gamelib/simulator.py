@@ -0,0 +1,532 @@
+import copy
+
+from .game_map import EDGES, range_offsets, range_locations
+from .navigation import ShortestPathFinder, ARENA_TILES
+
+ARENA_SIZE = 28
+BOARD_CELLS = ARENA_SIZE * ARENA_SIZE
+
+
+def _max_squared_distance(radius, hit_radius):
+    """Largest squared distance between two tiles that are within radius of each other,
+    using the distance < radius + hit_radius test of get_locations_in_range. -1 for no range.
+    """
+    if radius <= 0:
+        return -1
+    return max(dx * dx + dy * dy for dx, dy, _ in range_offsets(radius, hit_radius))
+
+
+class SimulationResult:
+    """The outcome of a simulated action phase. Every per player list is indexed by
+    the player whose units did the action, 0 for you 1 for the enemy.
+
+    Attributes :
+        * frames (int): The number of frames simulated
+        * breaches ([int, int]): The number of mobile units of each player that reached their target edge
+        * player_damage ([float, float]): The health damage each player dealt to the opponent by breaching
+        * structure_damage ([float, float]): The damage each player dealt to enemy structures
+        * structures_destroyed ([list, list]): The [x, y] locations of the enemy structures each player destroyed
+        * units_lost ([int, int]): The number of mobile units each player lost, self destructs included
+        * self_destructs ([int, int]): The number of mobile units of each player that self destructed
+        * frame_outcomes (list): One dict per frame with the 'frame' number and the 'breaches',
+          'structures_destroyed', 'units_lost' and 'self_destructs' of that frame, when recorded
+
+    """
+    def __init__(self):
+        self.frames = 0
+        self.breaches = [0, 0]
+        self.player_damage = [0.0, 0.0]
+        self.structure_damage = [0.0, 0.0]
+        self.structures_destroyed = [[], []]
+        self.units_lost = [0, 0]
+        self.self_destructs = [0, 0]
+        self.frame_outcomes = []
+
+    def __str__(self):
+        return "frames: {} breaches: {} player damage: {} structure damage: {} structures destroyed: {} units lost: {}".format(
+            self.frames, self.breaches, self.player_damage, self.structure_damage,
+            [len(locations) for locations in self.structures_destroyed], self.units_lost)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Simulator:
+    """Simulates action phases on a snapshot of a game state.
+
+    The structures of the game state are copied into flat arrays once, so a Simulator can
+    play out many candidate attacks on the same board. Mobile units are stored as groups:
+    units of one deployment always share their location and path, so they move together
+    and only their health is tracked per unit.
+
+    Each frame follows the order of the game engine:
+        1. Supports shield the mobile units of their owner that entered their range, once per support
+        2. Mobile units move once every 1/speed frames. A unit reaching a tile of its target edge breaches,
+           a unit with no tile left on its path self destructs, dealing damage if it moved
+           at least selfDestructStepsRequired tiles
+        3. Every unit attacks the target get_target would choose. Structures attack first, then mobile
+           units in deployment order. Units destroyed earlier in the same frame still attack,
+           but are no longer picked as targets
+        4. Destroyed units are removed and, if a structure was destroyed, every mobile unit re-paths
+
+    Re-pathing starts from a fresh search, so the previous move direction of a unit is not taken
+    into account to break ties between equally good moves.
+
+    Attributes :
+        * game_state (:obj: GameState): The game state the board was copied from
+        * hit_radius (float): The getHitRadius used for every range test
+
+    """
+    def __init__(self, game_state):
+        """Copies the structures of a game state
+
+        Args:
+            game_state: The GameState to simulate, its structures are copied now so later changes are not seen
+
+        """
+        self.game_state = game_state
+        config = game_state.config
+        game_map = game_state.game_map
+        self.hit_radius = config["unitInformation"][0]["getHitRadius"]
+        self._pathfinder = ShortestPathFinder()
+        self._edges = EDGES
+        self._edge_sets = [set(x * ARENA_SIZE + y for x, y in edge) for edge in self._edges]
+        self._mobile_stats = {}
+        for type_config in config["unitInformation"]:
+            if type_config.get("unitCategory") == 1:
+                self._mobile_stats[type_config["shorthand"]] = self.__mobile_stats(type_config)
+
+        self._structure_mask = game_map.get_structure_mask()
+        self._structure_at = [-1] * BOARD_CELLS
+        self._owner = []
+        self._index = []
+        self._health = []
+        self._turrets = []
+        #_turret_cover[player][tile]: turrets that can attack a unit of player standing on tile
+        self._turret_cover = [{}, {}]
+        #_support_cover[player][tile]: (support, shield) pairs that shield a unit of player standing on tile
+        self._support_cover = [{}, {}]
+        self._turret_damage = {}
+        self._turret_reach = {}
+        self._structure_targets = {}
+        for x, y in game_map.mask_to_locations(self._structure_mask):
+            for unit in game_map._units_at(x, y):
+                if unit.stationary:
+                    self.__add_structure(unit, x, y, config)
+                    break
+        self._default_deployments = self.__read_mobile_units(game_map)
+
+    def __mobile_stats(self, type_config):
+        attack_range = type_config.get("attackRange", 0)
+        self_destruct_range = type_config.get("selfDestructRange", 0)
+        return (
+            type_config.get("speed", 0),
+            type_config.get("attackDamageTower", 0),
+            type_config.get("attackDamageWalker", 0),
+            attack_range,
+            _max_squared_distance(attack_range, self.hit_radius),
+            type_config.get("startHealth", 0),
+            type_config.get("playerBreachDamage", 1),
+            type_config.get("selfDestructStepsRequired", 5),
+            type_config.get("selfDestructDamageTower", 0),
+            type_config.get("selfDestructDamageWalker", 0),
+            self_destruct_range,
+        )
+
+    def __add_structure(self, unit, x, y, config):
+        structure = len(self._owner)
+        index = x * ARENA_SIZE + y
+        owner = unit.player_index
+        self._structure_at[index] = structure
+        self._owner.append(owner)
+        self._index.append(index)
+        self._health.append(unit.health)
+        if unit.damage_i > 0 and unit.attackRange > 0:
+            self._turrets.append(structure)
+            self._turret_damage[structure] = unit.damage_i
+            self._turret_reach[structure] = _max_squared_distance(unit.attackRange, self.hit_radius)
+            cover = self._turret_cover[1 - owner]
+            for i, j in range_locations(x, y, unit.attackRange, self.hit_radius):
+                cover.setdefault(i * ARENA_SIZE + j, []).append(structure)
+        if unit.shieldRange > 0 and unit.shieldPerUnit > 0:
+            type_config = next(t for t in config["unitInformation"] if t.get("shorthand") == unit.unit_type)
+            bonus_per_y = type_config.get("shieldBonusPerY", 0)
+            if unit.upgraded:
+                bonus_per_y = type_config.get("upgrade", {}).get("shieldBonusPerY", bonus_per_y)
+            shield = unit.shieldPerUnit + bonus_per_y * (y if owner == 0 else ARENA_SIZE - 1 - y)
+            cover = self._support_cover[owner]
+            for i, j in range_locations(x, y, unit.shieldRange, self.hit_radius):
+                cover.setdefault(i * ARENA_SIZE + j, []).append((structure, shield))
+
+    def _structures_in_range(self, owner, x, y, attack_range):
+        """Lists the enemy structures a mobile unit of owner at [x, y] can attack, as one list per distance,
+        nearest first. Each entry is a (structure, tie_break) pair, tie_break holding the parts of the
+        get_target ordering that do not change during an action phase. The lists are cached, since
+        structures are only ever destroyed, so every simulation run by this Simulator shares them.
+        """
+        key = (owner, x, y, attack_range)
+        groups = self._structure_targets.get(key)
+        if groups is not None:
+            return groups
+        by_distance = {}
+        structure_at = self._structure_at
+        for dx, dy, _ in range_offsets(attack_range, self.hit_radius):
+            tx, ty = x + dx, y + dy
+            if not (0 <= tx < ARENA_SIZE and 0 <= ty < ARENA_SIZE):
+                continue
+            structure = structure_at[tx * ARENA_SIZE + ty]
+            if structure < 0 or self._owner[structure] == owner:
+                continue
+            tie_break = (ty if owner == 0 else -ty, -abs(2 * tx - ARENA_SIZE + 1))
+            by_distance.setdefault(dx * dx + dy * dy, []).append((structure, tie_break))
+        groups = self._structure_targets[key] = [by_distance[distance] for distance in sorted(by_distance)]
+        return groups
+
+    def __read_mobile_units(self, game_map):
+        deployments = {}
+        mobile_mask = game_map.get_mobile_mask()
+        for x, y, index in ARENA_TILES:
+            if not (mobile_mask >> index) & 1:
+                continue
+            for unit in game_map._units_at(x, y):
+                if not unit.stationary and unit.unit_type in self._mobile_stats:
+                    deployments.setdefault((unit.unit_type, x, y, unit.player_index), []).append(unit.health)
+        return [(unit_type, [x, y], healths, player_index) for (unit_type, x, y, player_index), healths in deployments.items()]
+
+    def simulate(self, deployments=None, max_frames=None, record_frames=True):
+        """Plays out an action phase on the copied board
+
+        Args:
+            deployments: A list of [unit_type, location, num] or [unit_type, location, num, player_index]
+                entries, player_index defaulting to 0. num can also be a list with the health of each unit. If None, the mobile units on the copied game map
+                are used, such as the ones you spawned with attempt_spawn this turn.
+            max_frames: Stop after this many frames, runs until no mobile unit is left if None
+            record_frames: Whether to fill frame_outcomes of the result
+
+        Returns:
+            A SimulationResult. The copied board is left untouched, so simulate can be called again.
+
+        """
+        if deployments is None:
+            deployments = self._default_deployments
+        return _ActionPhase(self, deployments).run(max_frames, record_frames)
+
+    def simulate_batch(self, candidates, max_frames=None, record_frames=False):
+        """Plays out several candidate deployments against the copied board, one after the other
+
+        The candidates share the caches of this Simulator: the enemy structures each tile can
+        target and the path fields of every structure layout reached, so the targeting scans and
+        the path searches done for one candidate are reused by the next ones. Identical candidates
+        are simulated once.
+
+        Args:
+            candidates: A list of deployment lists, each in the format taken by simulate
+            max_frames: Stop each simulation after this many frames, runs until no mobile unit is left if None
+            record_frames: Whether to fill frame_outcomes of the results
+
+        Returns:
+            A list with one SimulationResult per candidate, in the same order
+
+        """
+        results = []
+        by_key = {}
+        for deployments in candidates:
+            key = tuple((deployment[0], tuple(deployment[1]), tuple(deployment[2]) if isinstance(deployment[2], list) else deployment[2],
+                         deployment[3] if len(deployment) > 3 else 0) for deployment in deployments)
+            result = by_key.get(key)
+            if result is None:
+                result = by_key[key] = self.simulate(deployments, max_frames, record_frames)
+                results.append(result)
+            else:
+                results.append(copy.deepcopy(result))
+        return results
+
+
+class _ActionPhase:
+    """The mutable state of one simulated action phase, mobile units stored as parallel lists per group
+    """
+    def __init__(self, simulator, deployments):
+        self.sim = simulator
+        self.structure_at = list(simulator._structure_at)
+        self.health = list(simulator._health)
+        self.structure_mask = simulator._structure_mask
+        self.result = SimulationResult()
+        self.owner = []
+        self.stats = []
+        self.x = []
+        self.y = []
+        self.edge = []
+        self.path = []
+        self.step = []
+        self.progress = []
+        self.moved = []
+        self.healths = []
+        self.alive = []
+        self.shielded = []
+        self.active = []
+        game_state = simulator.game_state
+        for deployment in deployments:
+            unit_type, location, num = deployment[0], deployment[1], deployment[2]
+            player_index = deployment[3] if len(deployment) > 3 else 0
+            stats = simulator._mobile_stats.get(unit_type)
+            x, y = location
+            if stats is None or not game_state.game_map.in_arena_bounds(location) or self.structure_at[x * ARENA_SIZE + y] >= 0:
+                game_state.warn("Could not simulate {} at {}, not a mobile unit or the location is blocked.".format(unit_type, location))
+                continue
+            healths = list(num) if isinstance(num, list) else [stats[5]] * num
+            if not healths:
+                continue
+            self.owner.append(player_index)
+            self.stats.append(stats)
+            self.x.append(x)
+            self.y.append(y)
+            self.edge.append(game_state.get_target_edge(location))
+            self.path.append(None)
+            self.step.append(0)
+            self.progress.append(0.0)
+            self.moved.append(0)
+            self.healths.append(healths)
+            self.alive.append(len(healths))
+            self.shielded.append(set())
+            self.active.append(True)
+        self.groups = list(range(len(self.owner)))
+        self.repath()
+
+    def run(self, max_frames, record_frames):
+        result = self.result
+        frame = 0
+        while self.groups and (max_frames is None or frame < max_frames):
+            frame += 1
+            self.frame_breaches = [0, 0]
+            self.frame_destroyed = [[], []]
+            self.frame_lost = [0, 0]
+            self.frame_self_destructs = [0, 0]
+            self.dying = []
+            self.shield()
+            self.move()
+            self.attack()
+            self.remove_dead()
+            if record_frames:
+                result.frame_outcomes.append({
+                    "frame": frame,
+                    "breaches": self.frame_breaches,
+                    "structures_destroyed": self.frame_destroyed,
+                    "units_lost": self.frame_lost,
+                    "self_destructs": self.frame_self_destructs,
+                })
+        result.frames = frame
+        return result
+
+    def repath(self):
+        """Recomputes the path of every active group from its location, one batch per target edge
+        """
+        by_edge = {}
+        for group in self.groups:
+            by_edge.setdefault(self.edge[group], []).append(group)
+        sim = self.sim
+        for edge, groups in by_edge.items():
+            starts = [[self.x[group], self.y[group]] for group in groups]
+            paths = sim._pathfinder.navigate_with_layout(starts, sim._edges[edge], self.structure_mask)
+            for group, path in zip(groups, paths):
+                self.path[group] = path
+                self.step[group] = 0
+
+    def shield(self):
+        support_cover = self.sim._support_cover
+        health = self.health
+        for group in self.groups:
+            supports = support_cover[self.owner[group]].get(self.x[group] * ARENA_SIZE + self.y[group])
+            if not supports:
+                continue
+            shielded = self.shielded[group]
+            healths = self.healths[group]
+            for support, shield in supports:
+                if support in shielded or health[support] <= 0:
+                    continue
+                shielded.add(support)
+                for unit in range(len(healths)):
+                    if healths[unit] > 0:
+                        healths[unit] += shield
+
+    def move(self):
+        for group in list(self.groups):
+            stats = self.stats[group]
+            progress = self.progress[group] + stats[0]
+            if progress < 1:
+                self.progress[group] = progress
+                continue
+            self.progress[group] = progress - 1
+            path = self.path[group]
+            step = self.step[group] + 1
+            if step >= len(path):
+                self.self_destruct(group)
+                continue
+            x, y = path[step]
+            self.step[group] = step
+            self.x[group] = x
+            self.y[group] = y
+            self.moved[group] += 1
+            if x * ARENA_SIZE + y in self.sim._edge_sets[self.edge[group]]:
+                self.breach(group)
+
+    def breach(self, group):
+        owner = self.owner[group]
+        count = self.alive[group]
+        self.result.breaches[owner] += count
+        self.frame_breaches[owner] += count
+        self.result.player_damage[owner] += count * self.stats[group][6]
+        self.deactivate(group)
+
+    def self_destruct(self, group):
+        owner = self.owner[group]
+        stats = self.stats[group]
+        count = self.alive[group]
+        self.result.self_destructs[owner] += count
+        self.frame_self_destructs[owner] += count
+        self.result.units_lost[owner] += count
+        self.frame_lost[owner] += count
+        if self.moved[group] >= stats[7]:
+            sim = self.sim
+            x, y = self.x[group], self.y[group]
+            for i, j in range_locations(x, y, stats[10], sim.hit_radius):
+                index = i * ARENA_SIZE + j
+                structure = self.structure_at[index]
+                if structure >= 0 and sim._owner[structure] != owner and self.health[structure] > 0:
+                    self.damage_structure(structure, count * stats[8], owner)
+                for other in self.groups:
+                    if self.owner[other] != owner and self.x[other] == i and self.y[other] == j:
+                        healths = self.healths[other]
+                        for unit in range(len(healths)):
+                            if healths[unit] > 0:
+                                self.hit_unit(other, unit, count * stats[9])
+        self.deactivate(group)
+
+    def deactivate(self, group):
+        self.active[group] = False
+        self.alive[group] = 0
+        self.groups.remove(group)
+
+    def damage_structure(self, structure, damage, owner):
+        health = self.health
+        dealt = min(damage, health[structure])
+        health[structure] -= damage
+        self.result.structure_damage[owner] += dealt
+        if health[structure] <= 0:
+            self.dying.append(structure)
+
+    def attack(self):
+        groups = self.groups
+        attackers = [self.alive[group] for group in groups]
+        turret_cover = self.sim._turret_cover
+        turrets = set()
+        for group in groups:
+            cover = turret_cover[self.owner[group]].get(self.x[group] * ARENA_SIZE + self.y[group])
+            if cover:
+                turrets.update(cover)
+        health = self.health
+        for turret in sorted(turrets):
+            if health[turret] > 0:
+                self.turret_attack(turret)
+        for group, count in zip(groups, attackers):
+            if count > 0:
+                self.unit_attack(group, count)
+
+    def mobile_target(self, owner, x, y, reach, exclude_owner):
+        """Finds the enemy mobile unit get_target would pick for an attacker at [x, y], as a (group, unit) pair
+        """
+        best = None
+        best_key = None
+        for group in self.groups:
+            if self.owner[group] == exclude_owner or self.alive[group] <= 0:
+                continue
+            tx, ty = self.x[group], self.y[group]
+            distance = (tx - x) ** 2 + (ty - y) ** 2
+            if distance > reach:
+                continue
+            healths = self.healths[group]
+            unit = None
+            for i in range(len(healths)):
+                if healths[i] > 0 and (unit is None or healths[i] < healths[unit]):
+                    unit = i
+            key = (distance, healths[unit], ty if owner == 0 else -ty, -abs(2 * tx - ARENA_SIZE + 1), tx, ty)
+            if best_key is None or key < best_key:
+                best = (group, unit)
+                best_key = key
+        return best
+
+    def structure_target(self, owner, x, y, attack_range):
+        """Finds the enemy structure get_target would pick for a mobile unit of owner at [x, y]
+        """
+        health = self.health
+        for candidates in self.sim._structures_in_range(owner, x, y, attack_range):
+            best = -1
+            best_key = None
+            for structure, tie_break in candidates:
+                if health[structure] <= 0:
+                    continue
+                key = (health[structure], tie_break)
+                if best_key is None or key < best_key:
+                    best = structure
+                    best_key = key
+            if best >= 0:
+                return best
+        return -1
+
+    def hit_unit(self, group, unit, damage):
+        healths = self.healths[group]
+        healths[unit] -= damage
+        if healths[unit] <= 0:
+            self.alive[group] -= 1
+            owner = self.owner[group]
+            self.result.units_lost[owner] += 1
+            self.frame_lost[owner] += 1
+
+    def turret_attack(self, turret):
+        sim = self.sim
+        owner = sim._owner[turret]
+        x, y = divmod(sim._index[turret], ARENA_SIZE)
+        target = self.mobile_target(owner, x, y, sim._turret_reach[turret], owner)
+        if target is not None:
+            self.hit_unit(target[0], target[1], sim._turret_damage[turret])
+
+    def unit_attack(self, group, count):
+        """Makes the count units of a group attack, re-targeting whenever a target is destroyed
+        """
+        owner = self.owner[group]
+        stats = self.stats[group]
+        damage_f, damage_i, attack_range, reach = stats[1], stats[2], stats[3], stats[4]
+        x, y = self.x[group], self.y[group]
+        while count > 0:
+            target = self.mobile_target(owner, x, y, reach, owner) if damage_i > 0 else None
+            if target is not None:
+                target_group, unit = target
+                healths = self.healths[target_group]
+                while count > 0 and healths[unit] > 0:
+                    self.hit_unit(target_group, unit, damage_i)
+                    count -= 1
+                continue
+            structure = self.structure_target(owner, x, y, attack_range) if damage_f > 0 else -1
+            if structure < 0:
+                return
+            health = self.health
+            while count > 0 and health[structure] > 0:
+                self.damage_structure(structure, damage_f, owner)
+                count -= 1
+
+    def remove_dead(self):
+        for group in list(self.groups):
+            if self.alive[group] <= 0:
+                self.deactivate(group)
+        if not self.dying:
+            return
+        sim = self.sim
+        for structure in self.dying:
+            index = sim._index[structure]
+            self.structure_at[index] = -1
+            self.structure_mask &= ~(1 << index)
+            owner = 1 - sim._owner[structure]
+            location = list(divmod(index, ARENA_SIZE))
+            self.result.structures_destroyed[owner].append(location)
+            self.frame_destroyed[owner].append(location)
+        if self.groups:
+            self.repath()
@@ -1,7 +1,37 @@
 import unittest
 import json
-from .game_state import GameState
+import io
+import queue
+import sys
+import contextlib
+import os
+import tempfile
+import glob
+import random
+import time
+from .game_state import GameState, LazyGameState
 from .unit import GameUnit
+from .navigation import ShortestPathFinder
+from .simulator import Simulator
+from .util import decode, set_decoder
+from .algocore import AlgoCore
+from .turn_clock import TurnClock
+from .profiler import Profiler
+from .resource_forecast import ResourceForecast
+from . import benchmark
+from .worker_pool import WorkerPool, simulate_deployments, snapshot, restore
+
+def _sleep_task(game_state, seconds):
+    """WorkerPool task that waits, to test timeouts
+    """
+    time.sleep(seconds)
+    return seconds
+
+def _failing_task(game_state, value):
+    """WorkerPool task that raises for a value of 0, to test failing tasks
+    """
+    return 1 / value
+
 
 class BasicTests(unittest.TestCase):
 
@@ -275,3 +305,554 @@ class BasicTests(unittest.TestCase):
         actual = game.project_future_MP(turns)
         self.assertAlmostEqual(actual, expected, 0, "Expected {} MP {} turns from now, got {}".format(expected, turns, actual))
 
+
+    def test_resource_forecast(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("EF", [13, 5])
+        game.attempt_upgrade([13, 5])
+        forecast = ResourceForecast(game, 5)
+        self.assertEqual(forecast.income[0][0], [6.0, 6.0], "Supports should add their income")
+        self.assertEqual(forecast.project()[:2], [[17, 5], [23, 9.8]], "Wrong projection")
+        enemy = [mp for _, mp in forecast.project(1)[1:4]]
+        self.assertEqual(enemy, [game.project_future_MP(turns, 1) for turns in range(1, 4)], "Should match project_future_MP")
+        self.assertEqual(forecast.project(spends=[[0, 5]])[1], [23, 6.0], "Spending should reduce the projection")
+        self.assertFalse(forecast.affordable(spends=[[0, 6]]), "Cannot spend more than held")
+        self.assertTrue(forecast.affordable(spends=[[0, 5], [0, 6]]), "The plan should be affordable")
+        self.assertEqual(forecast.turns_until([0, 12]), 2, "Wrong wait")
+        self.assertIsNone(forecast.turns_until([0, 1000]), "The horizon is too short")
+
+        forecast = ResourceForecast(game, 12)
+        self.assertEqual(forecast.max_bits, [150.0] * 12, "The MP cap should stay at maxBits")
+        capped = [mp for _, mp in forecast.project(1, resources=[0, 1000])[1:]]
+        self.assertEqual(capped[:2], [150.0, 117.5], "MP should be capped before decaying")
+        self.assertEqual(capped, [game.project_future_MP(turns, 1, 1000) for turns in range(1, 13)], "project_future_MP should cap MP too")
+
+    def test_find_path_to_edge(self):
+        game = self.make_turn_0_map()
+
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], path[0], "Path should start at the start location")
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "Path should end on the top right edge")
+        self.assertEqual(29, len(path), "Unobstructed path has the wrong length")
+
+        for x in range(10, 17):
+            game.game_map.add_unit("FF", [x, 3])
+        for y in range(0, 3):
+            game.game_map.add_unit("FF", [16, y])
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([[13, 0], [13, 1], [14, 1], [14, 2], [15, 2]], path, "Enclosed unit should path to its self destruct location")
+        self.assertEqual(None, game.find_path_to_edge([13, 3]), "Pathing from a blocked location should fail")
+
+    def test_find_paths_to_edge_batch(self):
+        game = self.make_turn_0_map()
+        for x in range(10, 17):
+            game.game_map.add_unit("FF", [x, 3])
+        for y in range(0, 3):
+            game.game_map.add_unit("FF", [16, y])
+        for x in range(3, 9):
+            game.game_map.add_unit("DF", [x, 13], 1)
+
+        starts = [[13, 0], [16, 2], [4, 9], [23, 9], [14, 1], [20, 6]]
+        paths = game.find_paths_to_edge_batch(starts)
+        self.assertEqual(len(starts), len(paths), "There should be one path per start location")
+        for start, path in zip(starts, paths):
+            self.assertEqual(game.find_path_to_edge(start), path, "Batch path from {} differs from single path".format(start))
+        self.assertEqual(None, paths[1], "Pathing from a blocked location should fail")
+
+    def test_pathing_cache_follows_layout(self):
+        game = self.make_turn_0_map()
+        open_path = game.find_path_to_edge([13, 0])
+        open_path[1][0] = -1
+        self.assertEqual(game.find_path_to_edge([14, 0]), game.find_path_to_edge([14, 0]), "Cached path should be stable")
+        self.assertNotEqual(-1, game.find_path_to_edge([13, 0])[1][0], "Editing a returned path should not change the cache")
+
+        game.game_map.add_unit("FF", [13, 1])
+        blocked_path = game.find_path_to_edge([13, 0])
+        self.assertNotIn([13, 1], blocked_path, "Path should avoid a newly added wall")
+
+        game.game_map.remove_unit([13, 1])
+        self.assertEqual(game.find_path_to_edge([13, 0])[1], [13, 1], "Path should use the tile again once the wall is removed")
+
+    def test_pathing_repair_matches_full_search(self):
+        game = self.make_turn_0_map()
+        for x in range(5, 23):
+            game.game_map.add_unit("FF", [x, 13 - abs(x - 13) // 3])
+        starts = [location for location in game.game_map if not game.contains_stationary_unit(location)][::5]
+        game.find_paths_to_edge_batch(starts)
+
+        for toggled in [[13, 13], [14, 9], [9, 10], [13, 2], [20, 13]]:
+            if game.contains_stationary_unit(toggled):
+                game.game_map.remove_unit(toggled)
+            else:
+                game.game_map.add_unit("FF", toggled)
+            for location in starts:
+                if game.contains_stationary_unit(location):
+                    continue
+                end_points = game.game_map.get_edge_locations(game.get_target_edge(location))
+                expected = ShortestPathFinder().navigate_multiple_endpoints(location, end_points, game)
+                self.assertEqual(expected, game.find_path_to_edge(location), "Repaired path from {} differs after toggling {}".format(location, toggled))
+
+    def test_structure_masks(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        self.assertEqual(0, game_map.get_structure_mask(), "An empty map should have no structures")
+
+        game_map.add_unit("DF", [13, 13], 0)
+        game_map.add_unit("FF", [14, 14], 1)
+        game_map.add_unit("EI", [13, 1], 0)
+        self.assertTrue(game_map.is_blocked([13, 13]), "A turret should block its location")
+        self.assertFalse(game_map.is_blocked([13, 1]), "Mobile units should not block a location")
+        self.assertFalse(game_map.is_blocked([0, 0]), "Locations outside the arena are never blocked")
+        self.assertTrue(game_map.contains_structure([13, 13], "DF", 0), "Expected a friendly turret")
+        self.assertFalse(game_map.contains_structure([13, 13], "DF", 1), "The turret is not an enemy turret")
+        self.assertFalse(game_map.contains_structure([14, 14], "DF"), "A wall is not a turret")
+        self.assertEqual([[13, 13], [14, 14]], game_map.mask_to_locations(game_map.get_structure_mask()), "Wrong structure locations")
+        self.assertEqual([[14, 14]], game_map.mask_to_locations(game_map.get_type_mask("FF", 1)), "Wrong enemy wall locations")
+
+        game_map.remove_unit([13, 13])
+        self.assertFalse(game_map.contains_structure([13, 13]), "Removed structures should clear their bits")
+        self.assertEqual(0, game_map.get_type_mask("DF"), "No turrets should be left")
+
+        game_map[13, 13].append(GameUnit("FF", game.config, 0, None, 13, 13))
+        game_map.update_masks([13, 13])
+        self.assertTrue(game.contains_stationary_unit([13, 13]), "update_masks should pick up direct edits")
+
+        scout = GameUnit("PI", game.config, 1, None, 13, 14)
+        game_map[13, 14].append(scout)
+        turret = GameUnit("DF", game.config, 0, None, 13, 12)
+        game_map[13, 12].append(turret)
+        self.assertIs(scout, game.get_target(turret), "Units appended without update_masks should be targeted")
+        self.assertEqual([turret], game.get_attackers([13, 14], 1), "Structures appended without update_masks should attack")
+
+    def test_range_tables_match_scan(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        for radius in [0, 1.5, 2.5, 3.5, 4.5]:
+            for location in [[13, 13], [0, 13], [27, 14], [13, 0], [3, 11], [20, 25]]:
+                expected = []
+                for i in range(location[0] - 5, location[0] + 6):
+                    for j in range(location[1] - 5, location[1] + 6):
+                        if game_map.in_arena_bounds([i, j]) and game_map.distance_between_locations(location, [i, j]) < radius + 0.01:
+                            expected.append([i, j])
+                got = game_map.get_locations_in_range(location, radius)
+                self.assertEqual(expected, got, "Wrong locations in range {} of {}".format(radius, location))
+                got.append([-1, -1])
+                self.assertEqual(expected, game_map.get_locations_in_range(location, radius), "Cached range should not be shared with callers")
+
+    def test_get_targets_matches_get_target(self):
+        game = self.make_turn_0_map()
+        rng = random.Random(5)
+        locations = [location for location in game.game_map]
+        rng.shuffle(locations)
+        for x, y in locations[:80]:
+            game.game_map.add_unit(rng.choice(["FF", "EF", "DF"]), [x, y], 0 if y < 14 else 1)
+            game.game_map[x, y][0].health = rng.choice([10, 20, 30])
+        for x, y in locations[80:120]:
+            for _ in range(rng.randint(1, 3)):
+                game.game_map.add_unit(rng.choice(["PI", "EI", "SI"]), [x, y], rng.randint(0, 1))
+                game.game_map[x, y][-1].health = rng.choice([5, 10, 15])
+        pairs = game.get_targets()
+        self.assertEqual(len(pairs), sum(1 for location in game.game_map for unit in game.game_map[location] if unit.damage_i + unit.damage_f > 0), "Every attacker should be included")
+        self.assertTrue(any(target is not None for _, target in pairs), "Some attackers should have a target")
+        for attacker, target in pairs:
+            self.assertIs(target, game.get_target(attacker), "Wrong target for {}".format(attacker))
+
+    def test_mobile_unit_index(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        for _ in range(3):
+            game_map.add_unit("PI", [13, 0], 0)
+        game_map.add_unit("EI", [14, 20], 1)
+        game_map.add_unit("DF", [13, 20], 1)
+        self.assertEqual(game_map.get_mobile_count([13, 0], 0), 3, "Wrong count after add_unit")
+        self.assertEqual(game_map.mask_to_locations(game_map.get_mobile_mask()), [[13, 0], [14, 20]], "Wrong mobile mask")
+        self.assertEqual(game_map.mask_to_locations(game_map.get_occupied_mask(1)), [[13, 20], [14, 20]], "Wrong occupied mask")
+        self.assertEqual(game_map.get_locations_in_range([13, 17], 4.5, game_map.get_occupied_mask(1)), [[13, 20], [14, 20]], "Range should only keep occupied locations")
+
+        forked = game_map.fork()
+        forked.add_unit("PI", [13, 0], 0)
+        game_map.checkpoint()
+        game_map.remove_unit([13, 0])
+        self.assertEqual(game_map.get_mobile_count([13, 0]), 0, "Wrong count after remove_unit")
+        self.assertEqual(forked.get_mobile_count([13, 0]), 4, "Edits leaked between forks")
+        game_map.rollback()
+        self.assertEqual(game_map.get_mobile_count([13, 0], 0), 3, "Wrong count after rollback")
+        game_map.edit_location([13, 0]).pop()
+        game_map.update_masks([13, 0])
+        self.assertEqual(game_map.get_mobile_count([13, 0], 0), 2, "update_masks should recount mobile units")
+
+    def test_cached_edges(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        self.assertEqual(game_map.get_edge_locations(game_map.TOP_LEFT), game_map.get_edges()[game_map.TOP_LEFT], "Edges should match")
+        self.assertEqual(game_map.get_edge_locations(game_map.BOTTOM_RIGHT)[:2], [[14, 0], [15, 1]], "Wrong edge locations")
+        edge = game_map.get_edge_locations(game_map.BOTTOM_LEFT)
+        edge[0][0] = -1
+        edge.pop()
+        self.assertEqual([13, 0], game_map.get_edge_locations(game_map.BOTTOM_LEFT)[0], "Editing returned edges should not change the map")
+        self.assertEqual(14, len(game_map.get_edges()[game_map.BOTTOM_LEFT]), "Editing returned edges should not change the map")
+        self.assertTrue(game.can_spawn("PI", [13, 0]) and game.find_path_to_edge([13, 0]), "Editing returned edges should not change spawning or pathing")
+        for quadrant, edge in enumerate(game_map.get_edges()):
+            for location in game_map:
+                self.assertEqual(game_map.is_on_edge(location, quadrant), location in edge, "Wrong edge membership for {}".format(location))
+        self.assertFalse(game_map.is_on_edge([13, 5]) or game_map.is_on_edge([-1, 0]), "Only edge locations are on an edge")
+        self.assertTrue(game.can_spawn("PI", [0, 13]) and not game.can_spawn("PI", [0, 14]), "Mobile units spawn on our edges only")
+
+    def test_attempt_plan(self):
+        game = self.make_turn_0_map()
+        results = game.attempt_plan([("DF", [13, 11]), ("UP", [13, 11]), ("PI", [13, 0], 10000),
+                                     ("FF", [[13, 11], [12, 11]]), ("RM", [12, 11]), ("EI", [14, 0])])
+        self.assertEqual([done for done, _ in results], [1, 1, 5, 1, 1, 0], "Wrong number of units per item")
+        self.assertEqual(results[3][1], [([13, 11], "Location is blocked.")], "Wrong failure reason")
+        self.assertEqual(game.get_resources(), [18, 0], "Wrong resources left")
+        self.assertEqual(game._build_stack, [("DF", 13, 11), ("UP", 13, 11), ("FF", 12, 11), ("RM", 12, 11)], "Wrong build stack")
+        self.assertEqual(game._deploy_stack, [("PI", 13, 0)] * 5, "Wrong deploy stack")
+        self.assertTrue(game.game_map[13, 11][0].upgraded, "A structure spawned by the plan should be upgradable")
+        self.assertEqual(self.make_turn_0_map().attempt_spawn("PI", [13, 0], 10000), 5, "attempt_spawn should spawn what is affordable")
+
+        game = self.make_turn_0_map()
+        results = game.attempt_plan([("FF", [13, 5]), ("EI", [13, 0], 2)], all_or_nothing=True)
+        self.assertEqual([done for done, _ in results], [0, 0], "A failed plan should not be applied")
+        self.assertEqual((game.game_map[13, 5], game._build_stack, game.get_resources()), ([], [], [25, 5]), "A failed plan changed the game state")
+        self.assertEqual(game.attempt_plan([("PI", [13, 0], 0)]), [(0, [([13, 0], "Cannot spawn fewer than one unit.")])], "Spawning no units should fail")
+
+    def test_threat_map_matches_get_attackers(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [12, 14], 1)
+        game.game_map.add_unit("DF", [20, 16], 1)
+        game.game_map.add_unit("FF", [13, 14], 1)
+        threat_map = game.get_threat_map()
+
+        game.game_map.add_unit("DF", [14, 16], 1)
+        game.attempt_spawn("DF", [13, 11])
+        game.attempt_upgrade([13, 11])
+        game.game_map[20, 16][0].upgrade()
+        game.game_map.update_masks([20, 16])
+        game.game_map.remove_unit([12, 14])
+
+        for location in game.game_map:
+            for player_index in (0, 1):
+                attackers = game.get_attackers(location, player_index)
+                self.assertEqual(len(attackers), threat_map.get_attacker_count(location, player_index), "Wrong attacker count at {}".format(location))
+                self.assertEqual(sum(unit.damage_i for unit in attackers), threat_map.get_damage(location, player_index), "Wrong damage at {}".format(location))
+
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual(sum(len(game.get_attackers(location, 0)) for location in path), threat_map.path_attacker_count(path, 0), "Wrong path attacker count")
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        result = Simulator(game).simulate([["PI", [13, 0], 5]])
+        self.assertEqual(result.breaches, [5, 0], "Unblocked scouts should all breach")
+        self.assertEqual(result.player_damage, [5.0, 0.0], "Wrong breach damage")
+        enemy_result = Simulator(game).simulate([["PI", [13, 27], 2, 1]])
+        self.assertEqual(enemy_result.player_damage, [0.0, 2.0], "player_damage should be indexed by the breaching player")
+        self.assertEqual(result.frames, len(path) - 1, "Scouts move one tile per frame")
+        self.assertEqual(len(result.frame_outcomes), result.frames, "Missing frame outcomes")
+        self.assertEqual(result.frame_outcomes[-1]["breaches"], [5, 0], "Breaches should happen on the last frame")
+
+        game.game_map.add_unit("DF", path[len(path) // 2], 1)
+        game.attempt_upgrade([path[len(path) // 2]])
+        game.game_map.add_unit("PI", [13, 0], 0)
+        result = Simulator(game).simulate()
+        self.assertEqual(result.units_lost, [1, 0], "The turret should destroy the scout")
+        self.assertEqual(result.breaches, [0, 0], "Destroyed scouts should not breach")
+
+        game = self.make_turn_0_map()
+        game.attempt_spawn("FF", [[13, 1], [14, 1]])
+        result = Simulator(game).simulate([["PI", [13, 0], 3]])
+        self.assertEqual(result.self_destructs, [3, 0], "Boxed in scouts should self destruct")
+        self.assertEqual(result.structure_damage, [0.0, 0.0], "Self destructs need selfDestructStepsRequired steps to deal damage")
+
+    def test_simulate_batch(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 16], 1)
+        game.game_map.add_unit("FF", [14, 16], 1)
+        simulator = Simulator(game)
+        candidates = [[["PI", [13, 0], num]] for num in (1, 5, 10)] + [[["EI", [3, 10], 4], ["SI", [24, 10], 1]], [["PI", [13, 0], 5]]]
+        results = simulator.simulate_batch(candidates)
+        self.assertEqual(len(results), len(candidates), "One result per candidate")
+        for candidate, result in zip(candidates, results):
+            expected = Simulator(game).simulate(candidate)
+            self.assertEqual((result.frames, result.breaches, result.player_damage, result.structure_damage, result.structures_destroyed),
+                             (expected.frames, expected.breaches, expected.player_damage, expected.structure_damage, expected.structures_destroyed),
+                             "Batched result differs for {}".format(candidate))
+        self.assertIsNot(results[1], results[4], "Identical candidates should get their own result")
+
+    def test_worker_pool(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 16], 1)
+        game.attempt_spawn("FF", [13, 12])
+        game.attempt_upgrade([13, 12])
+        restored = restore(game.config, snapshot(game))
+        self.assertEqual(restored.game_map.get_structure_mask(), game.game_map.get_structure_mask(), "Snapshot lost structures")
+        self.assertTrue(restored.game_map[13, 12][0].upgraded, "Snapshot lost the upgrade")
+        self.assertEqual(restored.get_resources(), game.get_resources(), "Snapshot lost resources")
+
+        candidates = [([["PI", [13, 0], num]],) for num in (1, 4, 8)]
+        expected = [Simulator(game).simulate(args[0]).breaches for args in candidates]
+        for processes in (0, 2):
+            pool = WorkerPool(game.config, processes)
+            try:
+                pool.set_board(game)
+                results = pool.map(simulate_deployments, candidates)
+                self.assertEqual([result.breaches for result in results], expected, "Pool results differ with {} processes".format(processes))
+                args, result = pool.best(simulate_deployments, candidates, lambda result: result.breaches[0])
+                self.assertEqual(args, candidates[2], "Wrong best candidate")
+            finally:
+                pool.close()
+
+        pool = WorkerPool(game.config, 1)
+        try:
+            pool.set_board(game)
+            results = pool.map(_sleep_task, [(0.2,)] * 10, timeout=0.1)
+            self.assertEqual(results.count(None), 10, "Tasks that did not finish in time should give None")
+            started = time.perf_counter()
+            self.assertEqual(pool.map(_sleep_task, [(0,)]), [0], "The pool should still run tasks")
+            self.assertLess(time.perf_counter() - started, 1, "Timed out tasks should be cancelled")
+        finally:
+            pool.close()
+
+        for processes in (0, 1):
+            pool = WorkerPool(game.config, processes)
+            try:
+                pool.set_board(game)
+                output = io.StringIO()
+                with contextlib.redirect_stderr(output):
+                    results = pool.map(_failing_task, [(2,), (0,), (4,)])
+                self.assertEqual(results, [0.5, None, 0.25], "A failing task should give None with {} processes".format(processes))
+                self.assertIn("ZeroDivisionError", output.getvalue(), "The exception should be reported with {} processes".format(processes))
+            finally:
+                pool.close()
+
+    def test_clone_and_rollback(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 16], 1)
+        game.attempt_spawn("DF", [13, 11])
+        threat_map = game.get_threat_map()
+        mask = game.game_map.get_structure_mask()
+        resources = game.get_resources()
+
+        clone = game.clone()
+        clone.attempt_upgrade([13, 11])
+        clone.attempt_spawn("FF", [14, 11])
+        clone.game_map.remove_unit([13, 16])
+        clone.attempt_spawn("PI", [13, 0])
+        self.assertTrue(clone.game_map[13, 11][0].upgraded, "Clone did not upgrade")
+        self.assertFalse(game.game_map[13, 11][0].upgraded, "Upgrading the clone changed the original")
+        self.assertEqual(game.game_map.get_structure_mask(), mask, "Editing the clone changed the original masks")
+        self.assertEqual(game.get_resources(), resources, "Spending in the clone changed the original resources")
+        self.assertEqual(game.game_map[13, 0], [], "Spawning in the clone changed the original map")
+        self.assertEqual(threat_map.get_attacker_count([13, 14], 0), 1, "Editing the clone changed the original threat map")
+        self.assertEqual(clone.get_threat_map().get_attacker_count([13, 14], 0), 0, "The clone threat map was not updated")
+
+        game.game_map.remove_unit([13, 11])
+        self.assertTrue(clone.game_map.contains_structure([13, 11]), "Editing the original changed the clone")
+
+        clone.checkpoint()
+        clone.attempt_spawn("DF", [12, 11])
+        clone.checkpoint()
+        clone.game_map.remove_unit([14, 11])
+        clone.attempt_spawn("PI", [13, 0], 2)
+        clone.rollback()
+        self.assertTrue(clone.game_map.contains_structure([14, 11]), "Inner rollback did not restore the structure")
+        self.assertEqual(len(clone.game_map[13, 0]), 1, "Inner rollback did not remove the mobile units")
+        clone.rollback()
+        self.assertFalse(clone.game_map.contains_structure([12, 11]), "Outer rollback did not remove the structure")
+        self.assertEqual(clone._build_stack, [("DF", 13, 11), ("UP", 13, 11), ("FF", 14, 11)], "Rollback did not restore the build stack")
+
+    def test_unit_stats_are_shared(self):
+        game = self.make_turn_0_map()
+        first = GameUnit("DF", game.config, 0, None, 13, 11)
+        second = GameUnit("DF", game.config, 1, 10, 13, 16)
+        self.assertFalse(hasattr(first, "__dict__"), "Units should not have an instance dict")
+        self.assertIs(first._stats, second._stats, "Units of one type should share their stats")
+        self.assertEqual((first.health, second.health), (first.max_health, 10), "Wrong starting health")
+
+        base_range, base_cost = first.attackRange, first.cost
+        first.upgrade()
+        upgrade_config = game.config["unitInformation"][2]["upgrade"]
+        self.assertEqual(first.attackRange, upgrade_config.get("attackRange", base_range), "Upgrade did not change the range")
+        self.assertEqual(first.cost[0], base_cost[0] + upgrade_config.get("cost1", 0), "Upgraded cost should include the upgrade")
+        self.assertEqual(second.attackRange, base_range, "Upgrading a unit changed another unit")
+
+    def test_lazy_units_match_eager_parsing(self):
+        config = self.make_turn_0_map().config
+        frame = json.dumps({
+            "turnInfo": [1, 2, 4, 0], "p1Stats": [30.0, 10.0, 3.0, 0], "p2Stats": [28.0, 12.0, 1.0, 0], "events": {},
+            "p1Units": [[[13, 12, 75.0, "1"]], [], [[12, 12, 40.0, "2"], [11, 10, 90.0, "3"]], [[13, 1, 15.0, "4"], [13, 1, 7.0, "5"]], [], [], [[11, 10, 0, ""]], [[12, 12, 0, ""]]],
+            "p2Units": [[], [[14, 15, 30.0, "6"]], [], [], [[14, 20, 5.0, "7"]], [], [], []]})
+        eager = GameState(config, frame)
+        lazy = GameState(config, frame, lazy_units=True)
+        self.assertEqual(len(lazy.unit_store), 7, "Wrong number of rows")
+        for player_index in (None, 0, 1):
+            self.assertEqual(lazy.game_map.get_structure_mask(player_index), eager.game_map.get_structure_mask(player_index), "Lazy masks differ")
+            self.assertEqual(lazy.game_map.get_mobile_mask(player_index), eager.game_map.get_mobile_mask(player_index), "Lazy mobile masks differ")
+        self.assertEqual((lazy.game_map.get_mobile_count([13, 1], 0), eager.game_map.get_mobile_count([13, 1], 0)), (2, 2), "Wrong mobile unit count")
+        self.assertTrue(lazy.contains_stationary_unit([14, 15]), "Lazy map lost a structure")
+        for location in eager.game_map:
+            self.assertEqual(repr(lazy.game_map[location]), repr(eager.game_map[location]), "Lazy units differ at {}".format(location))
+        self.assertTrue(lazy.game_map[12, 12][0].upgraded and lazy.game_map[11, 10][0].pending_removal, "Lazy units lost their marks")
+
+    def test_lazy_game_state(self):
+        config = self.make_turn_0_map().config
+        state = {"turnInfo": [1, 3, 2, 0], "p1Stats": [30.0, 10.0, 3.0, 0], "p2Stats": [28.0, 12.0, 1.0, 0],
+                 "p1Units": [[[13, 12, 75.0, "1"]], [], [], [[13, 1, 15.0, "4"]], [], [], [], []],
+                 "p2Units": [[], [], [[14, 15, 90.0, "6"]], [], [], [], [], []],
+                 "events": {"breach": [[[13, 27], 1.0, 3, "4", 1]]}}
+        lazy = LazyGameState(config, state)
+        lazy.suppress_warnings(True)
+        self.assertEqual(lazy.turn_number, 3, "Wrong turn number")
+        self.assertEqual(lazy.events["breach"][0][0], [13, 27], "Wrong events")
+        self.assertNotIn("game_map", lazy.__dict__, "The board should not be built before it is used")
+
+        eager = GameState(config, json.dumps(state))
+        self.assertEqual(lazy.get_resources(1), eager.get_resources(1), "Wrong resources")
+        self.assertEqual(lazy.enemy_health, eager.enemy_health, "Wrong health")
+        self.assertFalse(lazy.game_map.enable_warnings, "Suppressed warnings were lost when building the board")
+        self.assertEqual(lazy.game_map.get_structure_mask(), eager.game_map.get_structure_mask(), "Wrong structures")
+        self.assertEqual(repr(lazy.game_map[13, 1]), repr(eager.game_map[13, 1]), "Wrong units")
+        self.assertEqual(GameState(config, state).game_map.get_structure_mask(), eager.game_map.get_structure_mask(), "A decoded state should parse like its string")
+
+    def test_decoder_backends(self):
+        message = '{"turnInfo": [1, 2, 3, 4], "p1Stats": [30.0, 1.5]}'
+        default = set_decoder()
+        try:
+            self.assertEqual(decode(message), json.loads(message), "The default decoder decodes differently")
+            self.assertEqual(set_decoder("not_a_json_module"), "json", "Unknown decoders should fall back to json")
+            calls = []
+            set_decoder(lambda text: calls.append(text) or json.loads(text))
+            decode(message)
+            self.assertEqual(calls, [message], "A custom decoder should be used")
+        finally:
+            set_decoder(default)
+
+    def test_action_frame_subscription(self):
+        empty = '{"turnInfo":[1,2,5,0],"events":{"selfDestruct":[],"breach":[],"damage":[],"death":[]}}'
+        breach = '{"turnInfo":[1,2,6,0],"events":{"selfDestruct":[],"breach":[[[13,27],1,3,"4",1]],"damage":[],"death":[]}}'
+        spaced = '{"turnInfo": [1, 2, 7, 0], "events": {"breach": [[[13, 27], 1, 3, "4", 1]], "death": []}}'
+        class RecordingCore(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.frames = []
+
+            def on_action_frame(self, state):
+                self.frames.append(state["turnInfo"][2])
+
+        core = RecordingCore()
+        self.assertTrue(core._raw_frame_check(empty), "Every frame should be passed without a subscription")
+        core.subscribe_action_frames(["breach"])
+        self.assertIs(core._raw_frame_check(empty), False, "Frames without breaches should be skipped before decoding")
+        self.assertIs(core._raw_frame_check(breach), True, "Frames with breaches should be passed")
+        self.assertIsNone(core._raw_frame_check(spaced), "Frames written differently should be decoded")
+        for message in (empty, breach, spaced):
+            core._handle_message(message)
+        self.assertEqual(core.frames, [6, 7], "Only frames with breaches should reach on_action_frame")
+        core.subscribe_action_frames(["death"])
+        core._handle_message(spaced)
+        core.subscribe_action_frames([])
+        core._handle_message(breach)
+        self.assertEqual(core.frames, [6, 7], "Decoded frames should be checked against the subscription")
+        self.assertEqual(core.skipped_action_frames, 3, "Wrong number of skipped frames")
+
+    def test_threaded_input(self):
+        class RecordingCore(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.received = []
+            def on_game_start(self, config):
+                self.received.append("config")
+            def on_turn(self, state):
+                self.received.append(("turn", state["turnInfo"][1]))
+            def on_action_frame(self, state):
+                self.received.append(("frame", state["turnInfo"][2]))
+        lines = ['{"replaySave": 1}', '{"turnInfo":[0,0,-1,0]}', '{"turnInfo":[1,0,0,0],"events":{}}',
+                 '{"turnInfo":[1,0,1,0],"events":{}}', '{"turnInfo":[2,0,2,0]}', '{"turnInfo":[0,1,-1,0]}']
+        expected = ["config", ("turn", 0), ("frame", 0), ("frame", 1)]
+        stdin = sys.stdin
+        try:
+            for threaded_input in (False, True):
+                core = RecordingCore()
+                sys.stdin = io.StringIO("\n".join(lines) + "\n")
+                core.start(threaded_input=threaded_input)
+                self.assertEqual(core.received, expected, "Wrong callbacks with threaded_input={}".format(threaded_input))
+        finally:
+            sys.stdin = stdin
+
+        messages = queue.Queue()
+        for frame in range(3):
+            messages.put(("", {"turnInfo": [1, 0, frame, 0], "events": {"breach": [frame]}}))
+        messages.put(("", {"turnInfo": [0, 1, -1, 0]}))
+        core = AlgoCore()
+        incoming = core._queued_messages(messages, True)
+        _, state = next(incoming)
+        self.assertEqual((state["turnInfo"][2], state["events"]["breach"]), (2, [0, 1, 2]), "Waiting frames should be merged into the latest")
+        self.assertEqual(next(incoming)[1]["turnInfo"][0], 0, "The turn after the frames should follow")
+        self.assertEqual(core.coalesced_action_frames, 2, "Wrong coalesced frame count")
+
+    def test_turn_clock(self):
+        def counter(steps=None):
+            step = 0
+            while steps is None or step < steps:
+                step += 1
+                yield step
+        clock = TurnClock(time_limit=0.05, safety_margin=0.02)
+        clock.start()
+        finished, interrupted = clock.run_all([counter(3), counter()])
+        self.assertEqual(finished, 3, "A finished search should return its last result")
+        self.assertTrue(interrupted > 3 and clock.expired(), "An endless search should run until the clock runs out")
+        self.assertLess(clock.elapsed(), 0.05, "The search should stop before the safety margin")
+        self.assertEqual(clock.remaining(), 0, "No time should be left")
+        self.assertIsNone(clock.run(counter()), "Nothing runs once the clock ran out")
+
+        game = self.make_turn_0_map()
+        core = AlgoCore()
+        core.set_turn_budget(0.05, 0.02)
+        core.turn_clock.start()
+        core.add_search(game, counter(), lambda state, best: state.attempt_spawn("PI", [13, 0], 1 if best else 0))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            core._run_searches()
+        self.assertEqual(output.getvalue().splitlines(), ["[]", '[["PI", 13, 0]]'], "The search result should be submitted")
+
+    def test_profiler(self):
+        find_path_to_edge = GameState.find_path_to_edge
+        profiler = Profiler()
+        profiler.count("ignored")
+        profiler.enable()
+        try:
+            game = self.make_turn_0_map()
+            for _ in range(3):
+                game.find_path_to_edge([13, 0])
+            game.attempt_spawn("PI", [13, 0])
+            with profiler.section("block"):
+                profiler.count("candidates", 2)
+        finally:
+            profiler.disable()
+        self.assertIs(GameState.find_path_to_edge, find_path_to_edge, "disable should restore the original functions")
+        self.assertEqual(len(profiler.durations["GameState.find_path_to_edge"]), 3, "Wrong call count")
+        self.assertEqual(len(profiler.durations["GameState.can_spawn"]), 1, "Nested calls should be counted")
+        self.assertEqual(profiler.counters, {"candidates": 2}, "Only counts made while enabled should be kept")
+        path = os.path.join(tempfile.mkdtemp(), "profile.txt")
+        profiler.output = path
+        profiler.end_turn(4, 0.01)
+        with open(path) as report:
+            lines = report.read().splitlines()
+        self.assertEqual(lines[0], "Turn 4 profile, 10.0 ms", "Wrong summary title")
+        self.assertTrue(any(line.startswith("  GameState.find_path_to_edge: 3 calls") for line in lines), "Missing timed function")
+        self.assertEqual(lines[-1], "  counters: candidates=2", "Missing counters")
+        self.assertEqual(profiler.summary(), "Profile", "end_turn should reset the profiler")
+
+    def test_benchmark(self):
+        replays = sorted(glob.glob(benchmark.DEFAULT_REPLAYS))
+        if not replays:
+            self.skipTest("No replay file to read the config from")
+        config, boards = benchmark.load_boards(replays[:1])
+        names = [name for name, _ in boards]
+        self.assertEqual(names[-2:], ["mid_game", "late_game"], "Generated boards are missing")
+        self.assertEqual(boards[-1][1], benchmark.generate_board(config, *benchmark.GENERATED_BOARDS[-1][1:]), "Generated boards should not change between runs")
+        results = benchmark.run_benchmarks(config, boards[-1:], min_time=0, repeat=1)
+        self.assertEqual(sorted(results), sorted(benchmark.BENCHMARKS), "Every benchmark should run")
+        self.assertTrue(all(ops > 0 for ops in results.values()), "Every benchmark should report its speed")
+        lines, regressions = benchmark.compare({"pathfinding": 80.0, "get_target": 100.0}, {"pathfinding": 100.0, "get_target": 100.0})
+        self.assertEqual(regressions, ["pathfinding"], "A 20% slowdown should be a regression")
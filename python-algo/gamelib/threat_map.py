@@ -0,0 +1,155 @@
+import math
+from array import array
+from .game_map import ROW_BOUNDS
+
+ARENA_SIZE = 28
+BOARD_CELLS = ARENA_SIZE * ARENA_SIZE
+
+_ATTACK_OFFSETS = {}
+
+
+def _attack_offsets(attack_range):
+    """Offsets of every tile a unit with the given attackRange can hit, using the same
+    distance <= attackRange test as GameState.get_attackers
+    """
+    offsets = _ATTACK_OFFSETS.get(attack_range)
+    if offsets is None:
+        search_radius = math.ceil(attack_range)
+        offsets = tuple((dx, dy) for dx in range(-search_radius, search_radius + 1)
+                        for dy in range(-search_radius, search_radius + 1)
+                        if math.sqrt(dx ** 2 + dy ** 2) <= attack_range)
+        _ATTACK_OFFSETS[attack_range] = offsets
+    return offsets
+
+
+class ThreatMap:
+    """Per tile damage that structures can deal to mobile units, for both players.
+
+    The map is built in one pass over the structures of a GameMap and then kept up to date
+    one location at a time: GameMap.update_masks forwards every structure change to the
+    threat map attached to it, so add_unit, remove_unit, attempt_spawn and attempt_upgrade
+    all keep it consistent. Get one through GameState.get_threat_map().
+
+    Unlike GameState.get_attackers, only structures are counted, mobile units are ignored.
+
+    Attributes :
+        * damage ([array, array]): damage[player_index][x * 28 + y] is the damage per frame
+          the enemy structures deal to a unit of player_index standing at [x, y]
+        * attackers ([array, array]): attackers[player_index][x * 28 + y] is the number of
+          enemy structures that can attack a unit of player_index standing at [x, y]
+
+    """
+    def __init__(self, game_map):
+        """Builds the threat map from the structures currently on the map
+
+        Args:
+            game_map: The GameMap to follow
+
+        """
+        self.game_map = game_map
+        self.damage = [array('d', [0.0]) * BOARD_CELLS, array('d', [0.0]) * BOARD_CELLS]
+        self.attackers = [array('i', [0]) * BOARD_CELLS, array('i', [0]) * BOARD_CELLS]
+        self.__sources = {}
+        for x, y in game_map.mask_to_locations(game_map.get_structure_mask()):
+            self.update_location([x, y])
+
+    def fork(self, game_map):
+        """Copies this threat map for a forked GameMap, see GameMap.fork
+
+        Args:
+            game_map: The forked GameMap the copy follows
+
+        Returns:
+            A new ThreatMap with the same values
+
+        """
+        forked = ThreatMap.__new__(ThreatMap)
+        forked.game_map = game_map
+        forked.damage = [array('d', damage) for damage in self.damage]
+        forked.attackers = [array('i', attackers) for attackers in self.attackers]
+        forked.__sources = dict(self.__sources)
+        return forked
+
+    def update_location(self, location):
+        """Replaces the contribution of the structure at a location with its current state
+
+        Args:
+            location: The location whose structure was added, removed or upgraded
+
+        """
+        x, y = location
+        index = x * ARENA_SIZE + y
+        old_source = self.__sources.pop(index, None)
+        if old_source is not None:
+            self.__apply(x, y, old_source, -1)
+        for unit in self.game_map._units_at(x, y):
+            if unit.stationary and unit.damage_i + unit.damage_f > 0 and unit.player_index in (0, 1):
+                source = (unit.player_index, unit.damage_i, unit.attackRange)
+                self.__sources[index] = source
+                self.__apply(x, y, source, 1)
+                break
+
+    def __apply(self, x, y, source, sign):
+        owner, damage_i, attack_range = source
+        damage = self.damage[1 - owner]
+        attackers = self.attackers[1 - owner]
+        for dx, dy in _attack_offsets(attack_range):
+            bounds = ROW_BOUNDS.get(y + dy)
+            if bounds is not None and bounds[0] <= x + dx <= bounds[1]:
+                index = (x + dx) * ARENA_SIZE + y + dy
+                damage[index] += sign * damage_i
+                attackers[index] += sign
+
+    def get_damage(self, location, player_index):
+        """Gets the damage per frame enemy structures deal to a unit at a location
+
+        Args:
+            location: The location of a hypothetical unit
+            player_index: The player controlling the hypothetical unit, 0 for you 1 for the enemy
+
+        Returns:
+            The summed attackDamageWalker of every enemy structure in range
+
+        """
+        return self.damage[player_index][location[0] * ARENA_SIZE + location[1]]
+
+    def get_attacker_count(self, location, player_index):
+        """Gets the number of enemy structures that can attack a unit at a location
+
+        Args:
+            location: The location of a hypothetical unit
+            player_index: The player controlling the hypothetical unit, 0 for you 1 for the enemy
+
+        Returns:
+            The number of enemy structures in range
+
+        """
+        return self.attackers[player_index][location[0] * ARENA_SIZE + location[1]]
+
+    def path_damage(self, path, player_index):
+        """Sums the damage per frame over every location of a path
+
+        Args:
+            path: A list of locations, such as the result of GameState.find_path_to_edge
+            player_index: The player controlling the unit walking the path
+
+        Returns:
+            The summed damage per frame of every location of the path
+
+        """
+        damage = self.damage[player_index]
+        return sum(damage[x * ARENA_SIZE + y] for x, y in path)
+
+    def path_attacker_count(self, path, player_index):
+        """Sums the number of enemy structures in range over every location of a path
+
+        Args:
+            path: A list of locations, such as the result of GameState.find_path_to_edge
+            player_index: The player controlling the unit walking the path
+
+        Returns:
+            The summed number of attackers of every location of the path
+
+        """
+        attackers = self.attackers[player_index]
+        return sum(attackers[x * ARENA_SIZE + y] for x, y in path)
@@ -0,0 +1,135 @@
+import time
+
+"""
+Seconds the engine allows per turn when the config does not say, see TurnClock.time_limit_from_config
+"""
+DEFAULT_TIME_LIMIT = 5.0
+
+
+class TurnClock:
+    """Measures the time left to submit the current turn.
+
+    AlgoCore starts its turn_clock when a turn message arrives, so on_turn can check how much
+    time it has left. The clock runs out safety_margin seconds before time_limit, which leaves
+    time to deploy the best move found so far and submit it.
+
+    Anytime searches are iterators, usually generators, that yield a better result each time
+    they yield. run and run_all step them until they finish or the clock runs out and return the
+    latest result. A search is only interrupted between two steps, so each step should be short.
+
+    Attributes :
+        * time_limit (float): The number of seconds allowed per turn
+        * safety_margin (float): The number of seconds kept free before time_limit
+        * started (float): The time.perf_counter() value when the current turn started
+        * last_turn_time (float): The number of seconds the previous turn took, None before the first turn ends
+
+    """
+    def __init__(self, time_limit=DEFAULT_TIME_LIMIT, safety_margin=0.5):
+        self.time_limit = time_limit
+        self.safety_margin = safety_margin
+        self.started = time.perf_counter()
+        self.last_turn_time = None
+
+    @staticmethod
+    def time_limit_from_config(config):
+        """Reads the time a turn can take before the engine penalises it
+
+        Args:
+            config: The game config
+
+        Returns:
+            The soft time limit of the config in seconds, DEFAULT_TIME_LIMIT if the config has none
+
+        """
+        timing = config.get("timingAndReplay", {})
+        if "waitTimeBotSoft" not in timing:
+            return DEFAULT_TIME_LIMIT
+        return timing["waitTimeBotSoft"] / 1000
+
+    def start(self, started=None):
+        """Starts timing a turn
+
+        Args:
+            started: The time.perf_counter() value the turn started at, now if None
+
+        """
+        self.started = time.perf_counter() if started is None else started
+
+    def stop(self):
+        """Ends the current turn and records how long it took in last_turn_time
+        """
+        self.last_turn_time = self.elapsed()
+
+    def elapsed(self):
+        """Gets the time spent in the current turn
+
+        Returns:
+            The number of seconds since the turn started
+
+        """
+        return time.perf_counter() - self.started
+
+    def remaining(self, safety_margin=None):
+        """Gets the time left before the clock runs out
+
+        Args:
+            safety_margin: The number of seconds to keep free, the clock's own safety_margin if None
+
+        Returns:
+            The number of seconds left, 0 once the clock ran out
+
+        """
+        margin = self.safety_margin if safety_margin is None else safety_margin
+        return max(0.0, self.time_limit - margin - self.elapsed())
+
+    def expired(self):
+        """Checks if the clock ran out
+
+        Returns:
+            True once less than safety_margin seconds are left, False otherwise
+
+        """
+        return time.perf_counter() - self.started >= self.time_limit - self.safety_margin
+
+    def run(self, search):
+        """Steps an anytime search until it finishes or the clock runs out
+
+        Args:
+            search: An iterator yielding a better result at each step
+
+        Returns:
+            The last result yielded, None if the search yielded nothing in time
+
+        """
+        return self.run_all([search])[0]
+
+    def run_all(self, searches):
+        """Steps several anytime searches in turn, one step each, until they all finish or the clock runs out.
+        Searches that did not finish are closed.
+
+        Args:
+            searches: A list of iterators yielding a better result at each step
+
+        Returns:
+            A list with the last result yielded by each search, None for searches that yielded nothing in time
+
+        """
+        results = [None] * len(searches)
+        iterators = [iter(search) for search in searches]
+        active = list(range(len(iterators)))
+        while active and not self.expired():
+            running = []
+            for i in active:
+                try:
+                    results[i] = next(iterators[i])
+                except StopIteration:
+                    continue
+                running.append(i)
+                if self.expired():
+                    break
+            active = running
+        for iterator in iterators:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        return results
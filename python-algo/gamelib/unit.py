@@ -2,15 +2,88 @@ def is_stationary(unit_type, structure_types):
     """
         Args:
             unit_type: A unit type
-        
-        Returns: 
+
+        Returns:
             Boolean, True if the unit is stationary, False otherwise.
     """
     return unit_type in structure_types
 
 
+class UnitStats:
+    """Holds the stats every unit of one type and upgrade level shares.
+    Built once per config by get_unit_stats, so units only keep a reference to it.
+
+    Attributes :
+        * config (JSON): The game config the stats were read from
+        * type_index (int): The index of this unit type in config["unitInformation"]
+        * stationary (bool): Whether or not this unit is a structures
+        * speed, damage_f, damage_i, attackRange, shieldRange, max_health, shieldPerUnit: See GameUnit
+        * cost ([int, int]): The resource costs of the unit, SP then MP, the upgrade included for upgraded stats
+
+    """
+    __slots__ = ("config", "type_index", "stationary", "speed", "damage_f", "damage_i", "attackRange",
+                 "shieldRange", "max_health", "shieldPerUnit", "cost")
+
+    def __init__(self, config, type_index, type_config, base=None):
+        self.config = config
+        self.type_index = type_index
+        if base is None:
+            self.stationary = type_config["unitCategory"] == 0
+            self.speed = type_config.get("speed", 0)
+            self.damage_f = type_config.get("attackDamageTower", 0)
+            self.damage_i = type_config.get("attackDamageWalker", 0)
+            self.attackRange = type_config.get("attackRange", 0)
+            self.shieldRange = type_config.get("shieldRange", 0)
+            self.max_health = type_config.get("startHealth", 0)
+            self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
+            self.cost = (type_config.get("cost1", 0), type_config.get("cost2", 0))
+        else:
+            upgrade_config = type_config.get("upgrade", {})
+            self.stationary = base.stationary
+            self.speed = upgrade_config.get("speed", base.speed)
+            self.damage_f = upgrade_config.get("attackDamageTower", base.damage_f)
+            self.damage_i = upgrade_config.get("attackDamageWalker", base.damage_i)
+            self.attackRange = upgrade_config.get("attackRange", base.attackRange)
+            self.shieldRange = upgrade_config.get("shieldRange", base.shieldRange)
+            self.max_health = upgrade_config.get("startHealth", base.max_health)
+            self.shieldPerUnit = upgrade_config.get("shieldPerUnit", base.shieldPerUnit)
+            self.cost = (upgrade_config.get("cost1", 0) + base.cost[0], upgrade_config.get("cost2", 0) + base.cost[1])
+
+
+"""
+Stat tables per config, keyed by id(config). Each entry keeps the config itself so a
+reused id is never mistaken for the config it used to belong to.
+"""
+_STAT_TABLES = {}
+
+
+def get_unit_stats(config):
+    """Gets the stat table of a config, building it on first use
+
+    Args:
+        config: The game config
+
+    Returns:
+        A dict mapping each unit type to a (base, upgraded) pair of UnitStats
+
+    """
+    entry = _STAT_TABLES.get(id(config))
+    if entry is None or entry[0] is not config:
+        table = {}
+        for type_index, type_config in enumerate(config["unitInformation"]):
+            if "unitCategory" not in type_config:
+                continue
+            base = UnitStats(config, type_index, type_config)
+            table[type_config["shorthand"]] = (base, UnitStats(config, type_index, type_config, base))
+        entry = _STAT_TABLES[id(config)] = (config, table)
+    return entry[1]
+
+
 class GameUnit:
-    """Holds information about a Unit. 
+    """Holds information about a Unit.
+
+    Units only store their own state. Their stats come from a UnitStats shared by every unit
+    of the same type and upgrade level, see get_unit_stats.
 
     Attributes :
         * unit_type (string): This unit's type
@@ -32,48 +105,79 @@ class GameUnit:
         * upgraded (boolean): If this unit is upgraded
 
     """
+    __slots__ = ("unit_type", "player_index", "x", "y", "health", "pending_removal", "upgraded", "_stats", "_type_stats")
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
         """
         self.unit_type = unit_type
-        self.config = config
         self.player_index = player_index
         self.pending_removal = False
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self._type_stats = get_unit_stats(config)[unit_type]
+        self._stats = self._type_stats[0]
+        self.health = self._stats.max_health if not health else health
+
+    @property
+    def config(self):
+        return self._stats.config
+
+    @property
+    def stationary(self):
+        return self._stats.stationary
+
+    @property
+    def speed(self):
+        return self._stats.speed
+
+    @property
+    def damage_f(self):
+        return self._stats.damage_f
 
+    @property
+    def damage_i(self):
+        return self._stats.damage_i
+
+    @property
+    def attackRange(self):
+        return self._stats.attackRange
+
+    @property
+    def shieldRange(self):
+        return self._stats.shieldRange
+
+    @property
+    def max_health(self):
+        return self._stats.max_health
+
+    @property
+    def shieldPerUnit(self):
+        return self._stats.shieldPerUnit
+
+    @property
+    def cost(self):
+        return list(self._stats.cost)
+
+    def __copy__(self):
+        unit = GameUnit.__new__(GameUnit)
+        unit.unit_type = self.unit_type
+        unit.player_index = self.player_index
+        unit.x = self.x
+        unit.y = self.y
+        unit.health = self.health
+        unit.pending_removal = self.pending_removal
+        unit.upgraded = self.upgraded
+        unit._stats = self._stats
+        unit._type_stats = self._type_stats
+        return unit
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        self._stats = self._type_stats[1]
         self.upgraded = True
 
-
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
         removal = ", pending removal" if self.pending_removal else ""
@@ -84,4 +188,3 @@ class GameUnit:
 
     def __repr__(self):
         return self.__toString()
-
@@ -0,0 +1,153 @@
+from array import array
+from .unit import GameUnit, get_unit_stats
+
+ARENA_SIZE = 28
+
+
+class UnitStore:
+    """Holds the units of a serialized game state as columns, one row per unit.
+
+    Rows are filled straight from the p1Units / p2Units lists of a game state, without making
+    GameUnit objects. A GameMap loaded from a store (see GameMap.load_store) only makes the
+    GameUnits of a location the first time that location is read. The structure bitmasks are
+    computed while filling the rows.
+
+    Attributes :
+        * config (JSON): The game config
+        * unit_type (list): The unit type of each row
+        * type_index (array): The index of each row's unit type in config["unitInformation"]
+        * player_index (array): The player controlling each row, 0 for you 1 for the enemy
+        * x (array): The x coordinate of each row
+        * y (array): The y coordinate of each row
+        * health (array): The health of each row
+        * unit_id (list): The id the game engine gave each row
+        * upgraded (bytearray): 1 for the rows that are upgraded
+        * pending_removal (bytearray): 1 for the rows marked for removal by their owner
+        * structure_masks ([int, int]): The structure bitmask of each player, see GameMap.get_structure_mask
+        * type_masks ([dict, dict]): The bitmask of each structure type for each player, see GameMap.get_type_mask
+        * mobile_masks ([int, int]): The mobile unit bitmask of each player, see GameMap.get_mobile_mask
+        * mobile_counts ([dict, dict]): The number of mobile units of each player per location index, see GameMap.get_mobile_count
+
+    """
+    def __init__(self, config, p1_units, p2_units):
+        """Fills the columns from the unit lists of a game state
+
+        Args:
+            config: The game config
+            p1_units: The "p1Units" list of a game state
+            p2_units: The "p2Units" list of a game state
+
+        """
+        self.config = config
+        self.unit_type = []
+        self.type_index = array('b')
+        self.player_index = array('b')
+        self.x = array('b')
+        self.y = array('b')
+        self.health = array('d')
+        self.unit_id = []
+        self.upgraded = bytearray()
+        self.pending_removal = bytearray()
+        self.structure_masks = [0, 0]
+        self.type_masks = [{}, {}]
+        self.mobile_masks = [0, 0]
+        self.mobile_counts = [{}, {}]
+        self.__tiles = {}
+        stats = get_unit_stats(config)
+        unit_information = config["unitInformation"]
+        self.__fill(p1_units, 0, stats, unit_information)
+        self.__fill(p2_units, 1, stats, unit_information)
+
+    def __fill(self, units, player_index, stats, unit_information):
+        structure_at = {}
+        tiles = self.__tiles
+        for type_index, unit_list in enumerate(units):
+            if not unit_list:
+                continue
+            unit_type = unit_information[type_index].get("shorthand")
+            type_stats = stats.get(unit_type)
+            if type_stats is None:
+                #Removal and upgrade markers, they apply to the structure of their location
+                upgrade = type_index == len(unit_information) - 1
+                marks = self.upgraded if upgrade else self.pending_removal
+                for uinfo in unit_list:
+                    row = structure_at.get(int(uinfo[0]) * ARENA_SIZE + int(uinfo[1]))
+                    if row is not None:
+                        marks[row] = 1
+                continue
+            first_row = len(self.unit_type)
+            count = len(unit_list)
+            xs = [int(uinfo[0]) for uinfo in unit_list]
+            ys = [int(uinfo[1]) for uinfo in unit_list]
+            self.unit_type.extend([unit_type] * count)
+            self.type_index.extend(array('b', [type_index]) * count)
+            self.player_index.extend(array('b', [player_index]) * count)
+            self.x.extend(xs)
+            self.y.extend(ys)
+            self.health.extend([float(uinfo[2]) for uinfo in unit_list])
+            self.unit_id.extend([uinfo[3] if len(uinfo) > 3 else None for uinfo in unit_list])
+            self.upgraded.extend(bytes(count))
+            self.pending_removal.extend(bytes(count))
+            stationary = type_stats[0].stationary
+            mobile_counts = self.mobile_counts[player_index]
+            type_mask = 0
+            for row, x, y in zip(range(first_row, first_row + count), xs, ys):
+                index = x * ARENA_SIZE + y
+                rows = tiles.get(index)
+                if rows is None:
+                    tiles[index] = [row]
+                else:
+                    rows.append(row)
+                if stationary:
+                    structure_at[index] = row
+                    type_mask |= 1 << index
+                else:
+                    mobile_counts[index] = mobile_counts.get(index, 0) + 1
+                    type_mask |= 1 << index
+            if type_mask and not stationary:
+                self.mobile_masks[player_index] |= type_mask
+            elif type_mask:
+                self.structure_masks[player_index] |= type_mask
+                type_masks = self.type_masks[player_index]
+                type_masks[unit_type] = type_masks.get(unit_type, 0) | type_mask
+
+    def __len__(self):
+        return len(self.unit_type)
+
+    def occupied(self):
+        """Gets the indexes x * 28 + y of the locations holding at least one unit
+
+        Returns:
+            An iterable of ints
+
+        """
+        return self.__tiles.keys()
+
+    def rows_at(self, location):
+        """Gets the rows of the units at a location
+
+        Args:
+            location: A map location
+
+        Returns:
+            A list of row indexes, in the order of the serialized game state
+
+        """
+        return self.__tiles.get(location[0] * ARENA_SIZE + location[1], [])
+
+    def make_unit(self, row):
+        """Makes the GameUnit of a row
+
+        Args:
+            row: A row index
+
+        Returns:
+            A new GameUnit with the type, owner, location, health, upgrade and removal mark of the row
+
+        """
+        unit = GameUnit(self.unit_type[row], self.config, self.player_index[row], self.health[row], self.x[row], self.y[row])
+        if self.upgraded[row]:
+            unit.upgrade()
+        if self.pending_removal[row]:
+            unit.pending_removal = True
+        return unit
@@ -1,8 +1,57 @@
+import importlib
+import json
 import sys
 
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
+"""
+Decoders for the messages of the game engine, fastest first. orjson and ujson are optional,
+the first one that imports is used and the standard json module is the fallback.
+"""
+DECODER_BACKENDS = ["orjson", "ujson", "json"]
+_decoder = None
+_decoder_name = None
+
+
+def set_decoder(decoder=None):
+    """Chooses how decode turns engine messages into python objects
+
+    Args:
+        decoder: The name of a module with a loads function ("orjson", "ujson" or "json"),
+            a function taking a string, or None to pick the fastest backend that imports
+
+    Returns:
+        The name of the decoder in use
+
+    """
+    global _decoder, _decoder_name
+    if callable(decoder):
+        _decoder, _decoder_name = decoder, getattr(decoder, "__name__", "custom")
+        return _decoder_name
+    for name in ([decoder] if decoder else DECODER_BACKENDS):
+        try:
+            module = json if name == "json" else importlib.import_module(name)
+        except ImportError:
+            continue
+        _decoder, _decoder_name = module.loads, name
+        return name
+    debug_write("Decoder {} is not available, using json".format(decoder))
+    return set_decoder("json")
+
+
+def decode(message):
+    """Decodes one message from the game engine with the decoder chosen by set_decoder
+
+    Args:
+        message: A json string
+
+    Returns:
+        The decoded object
+
+    """
+    return _decoder(message)
+
 
 def get_command():
     """Gets input from stdin
@@ -39,3 +88,6 @@ def debug_write(*msg):
     #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
     sys.stderr.write(", ".join(map(str, msg)).strip() + "\n")
     sys.stderr.flush()
+
+
+set_decoder()
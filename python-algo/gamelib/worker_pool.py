@@ -0,0 +1,252 @@
+import multiprocessing
+import os
+import pickle
+import time
+
+from .game_state import GameState
+from .navigation import ARENA_TILES
+from .simulator import Simulator
+from .util import debug_write
+
+_worker_config = None
+_worker_board = {"id": None}
+_worker_cancelled = None
+
+
+def snapshot(game_state):
+    """Packs the board of a game state into a small tuple of plain values that is cheap to pickle
+
+    Args:
+        game_state: The GameState to pack, including the units you spawned with attempt_spawn
+
+    Returns:
+        A tuple (turn_number, (my_health, my_time, enemy_health, enemy_time), ((SP, MP), (SP, MP)), units)
+        where units holds one list per player of (unit_type, x, y, health, upgraded, pending_removal) tuples
+
+    """
+    units = ([], [])
+    game_map = game_state.game_map
+    for x, y, _ in ARENA_TILES:
+        for unit in game_map._units_at(x, y):
+            if unit.player_index in (0, 1):
+                units[unit.player_index].append((unit.unit_type, x, y, unit.health, unit.upgraded, unit.pending_removal))
+    resources = tuple((game_state.get_resource(game_state.SP, i), game_state.get_resource(game_state.MP, i)) for i in (0, 1))
+    stats = (game_state.my_health, game_state.my_time, game_state.enemy_health, game_state.enemy_time)
+    return (game_state.turn_number, stats, resources, units)
+
+
+def restore(config, board):
+    """Rebuilds a GameState from a snapshot
+
+    Args:
+        config: The game config
+        board: A tuple returned by snapshot
+
+    Returns:
+        A new GameState holding the units of the snapshot
+
+    """
+    turn_number, stats, resources, units = board
+    type_index = {unit_info.get("shorthand"): i for i, unit_info in enumerate(config["unitInformation"])}
+    remove_index = len(config["unitInformation"]) - 2
+    upgrade_index = len(config["unitInformation"]) - 1
+    frame = {
+        "turnInfo": [0, turn_number, -1, 0],
+        "p1Stats": [stats[0], resources[0][0], resources[0][1], stats[1]],
+        "p2Stats": [stats[2], resources[1][0], resources[1][1], stats[3]],
+        "events": {},
+    }
+    for player_index, key in enumerate(("p1Units", "p2Units")):
+        unit_lists = [[] for _ in config["unitInformation"]]
+        for unit_type, x, y, health, upgraded, pending_removal in units[player_index]:
+            unit_lists[type_index[unit_type]].append([x, y, health, ""])
+            if upgraded:
+                unit_lists[upgrade_index].append([x, y, 0, ""])
+            if pending_removal:
+                unit_lists[remove_index].append([x, y, 0, ""])
+        frame[key] = unit_lists
+    game_state = GameState(config, frame)
+    game_state.suppress_warnings(True)
+    return game_state
+
+
+def simulate_deployments(game_state, deployments):
+    """Task that simulates one candidate deployment on the board of the worker, see Simulator.simulate
+
+    Returns:
+        A SimulationResult without frame outcomes
+
+    """
+    simulator = _worker_board.get("simulator")
+    if simulator is None or simulator.game_state is not game_state:
+        simulator = _worker_board["simulator"] = Simulator(game_state)
+    return simulator.simulate(deployments, record_frames=False)
+
+
+def path_damage(game_state, location):
+    """Task that sums the damage enemy structures deal along the path of a unit spawned at location
+
+    Returns:
+        The summed damage per frame along the path, None if the location is blocked
+
+    """
+    path = game_state.find_path_to_edge(location)
+    if path is None:
+        return None
+    return game_state.get_threat_map().path_damage(path, 0)
+
+
+def _init_worker(config, cancelled):
+    global _worker_config, _worker_cancelled
+    _worker_config = config
+    _worker_cancelled = cancelled
+
+
+def _run_task(batch_id, board_id, board, function, args):
+    """Runs a task in a worker, rebuilding the GameState only when the board changed.
+    Tasks of a map call whose deadline passed are skipped without doing any work.
+    """
+    if batch_id <= _worker_cancelled.value:
+        return None
+    if _worker_board["id"] != board_id:
+        _worker_board.clear()
+        _worker_board["state"] = restore(_worker_config, pickle.loads(board))
+        _worker_board["id"] = board_id
+    return function(_worker_board["state"], *args)
+
+
+class WorkerPool:
+    """Evaluates candidate moves on several cores.
+
+    The worker processes are started once, typically in on_game_start once the config is known,
+    and live for the whole game. Each turn, set_board packs the board into a small snapshot that is
+    pickled once and sent along with every task. Workers rebuild a GameState from it the first time
+    they see a new board and reuse it for every later task of the turn, so tasks must not modify it.
+
+    A task is a module level function taking the worker's GameState as first argument, such as
+    simulate_deployments or path_damage. With processes=0 tasks run in the calling process, which
+    is useful where starting processes is not possible.
+
+    When the timeout of a map call runs out, its tasks that have not started yet are cancelled:
+    workers skip them, so the next call does not wait behind stale work. Tasks already running
+    finish, their results are discarded.
+
+    Attributes :
+        * processes (int): The number of worker processes, 0 if tasks run in the calling process
+
+    """
+    def __init__(self, config, processes=None):
+        """Starts the worker processes
+
+        Args:
+            config: The game config, sent to every worker once
+            processes: The number of workers, one less than the number of cores if None
+
+        """
+        self.config = config
+        self.processes = max(1, (os.cpu_count() or 2) - 1) if processes is None else processes
+        self._board_id = 0
+        self._board = None
+        self._local_board = {"id": None}
+        self._batch_id = 0
+        self._pool = None
+        if self.processes > 0:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            #The id of the last map call whose remaining tasks must be skipped
+            self._cancelled = context.Value("q", 0, lock=False)
+            self._pool = context.Pool(self.processes, initializer=_init_worker, initargs=(config, self._cancelled))
+
+    def set_board(self, game_state):
+        """Sets the board every following task runs on
+
+        Args:
+            game_state: The GameState of the current turn, including any units you spawned so far
+
+        """
+        self._board_id += 1
+        self._board = pickle.dumps(snapshot(game_state), pickle.HIGHEST_PROTOCOL)
+
+    def map(self, function, arguments, timeout=None):
+        """Runs a task once per argument tuple and gathers the results
+
+        Args:
+            function: A module level function taking a GameState followed by the arguments
+            arguments: A list of argument tuples, one per task
+            timeout: The number of seconds to wait for results, waits for every task if None
+
+        Returns:
+            A list with the result of each task in the same order, None for tasks that did not finish
+            in time. Tasks that did not start in time are cancelled, running ones are left to finish.
+            Tasks that raised also give None, their exception is written to the debug output.
+
+        """
+        if self._board is None:
+            debug_write("WorkerPool.map was called before set_board, no task was run")
+            return [None] * len(arguments)
+        if self._pool is None:
+            return self.__map_locally(function, arguments, timeout)
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        self._batch_id += 1
+        pending = [self._pool.apply_async(_run_task, (self._batch_id, self._board_id, self._board, function, tuple(args)))
+                   for args in arguments]
+        results = [None] * len(pending)
+        for i, task in enumerate(pending):
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0 and not task.ready():
+                continue
+            task.wait(None if remaining is None else max(0, remaining))
+            if task.ready():
+                try:
+                    results[i] = task.get()
+                except Exception as error:
+                    debug_write("WorkerPool task {} raised {!r}".format(i, error))
+        if not all(task.ready() for task in pending):
+            self._cancelled.value = self._batch_id
+        return results
+
+    def __map_locally(self, function, arguments, timeout):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        if self._local_board["id"] != self._board_id:
+            self._local_board = {"id": self._board_id, "state": restore(self.config, pickle.loads(self._board))}
+        results = [None] * len(arguments)
+        for i, args in enumerate(arguments):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            try:
+                results[i] = function(self._local_board["state"], *args)
+            except Exception as error:
+                debug_write("WorkerPool task {} raised {!r}".format(i, error))
+        return results
+
+    def best(self, function, arguments, score, timeout=None):
+        """Runs a task once per argument tuple and returns the best finished one
+
+        Args:
+            function: A module level function taking a GameState followed by the arguments
+            arguments: A list of argument tuples, one per task
+            score: A function mapping a task result to a number, higher is better
+            timeout: The number of seconds to wait for results, waits for every task if None
+
+        Returns:
+            A (arguments, result) pair for the best task that finished in time, (None, None) if none did
+
+        """
+        best = (None, None)
+        best_score = None
+        for args, result in zip(arguments, self.map(function, arguments, timeout)):
+            if result is None:
+                continue
+            result_score = score(result)
+            if best_score is None or result_score > best_score:
+                best = (args, result)
+                best_score = result_score
+        return best
+
+    def close(self):
+        """Stops the worker processes
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None